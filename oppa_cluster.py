@@ -0,0 +1,339 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+oppa_cluster, multi-node sharded segmentation driver for oppa_word
+
+The coordinator splits an input corpus into shard files on shared storage (a single
+uncompressed input is only indexed, and shards are line spans of it) and hands
+them to workers over a small line-delimited JSON protocol on TCP. Every worker builds
+HybridDAGSegmenter from the model options it receives from the coordinator, so all
+workers use the same model bundle. Finished shards are merged in order into --output.
+
+Features:
+- Shard leases with timeout; shards of crashed or failing workers are retried (--max-retries)
+- Progress and per-worker throughput (lines/s) on stderr
+- 'run' mode starts a localhost coordinator plus N local worker processes
+
+Usage:
+  # one box, 4 local workers
+  python oppa_cluster.py run --workers 4 --input big.txt.gz --output big.seg \
+      --work-dir /shared/job1 --dict data/myg2p_mypos.dict --use-bimm-fallback --bimm-boost 150
+
+  # several boxes sharing /shared
+  python oppa_cluster.py coordinator --bind 0.0.0.0:7707 --input big.txt.gz --output big.seg \
+      --work-dir /shared/job1 --dict data/myg2p_mypos.dict
+  python oppa_cluster.py worker --connect coordinator-host:7707     # on each worker box
+
+Protocol (one JSON object per line, worker -> coordinator):
+  {"op": "hello", "worker": ID}              -> {"segmenter": {...}, "nbest": K}
+  {"op": "get", "worker": ID}                -> {"shard": i, "input": path, "output": path[, "span": [offset, skip, lines]]}
+                                                | {"wait": s} | {"done": true}
+  {"op": "complete", "worker": ID, "shard": i, "lines": n, "seconds": t}
+  {"op": "fail", "worker": ID, "shard": i, "error": msg}
+
+Author: Ye Kyaw Thu, LU Lab., Myanmar
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import threading
+
+from oppa_core import (HybridDAGSegmenter, add_model_arguments, validate_model_arguments,
+                       segmenter_kwargs_from_args, expand_input_paths, read_lines, open_text,
+                       format_line_output, atomic_write, LineIndex, read_line_span, _detect_compression)
+
+
+def split_into_shards(paths, shard_dir, shard_lines):
+    """
+    Shards of shard_lines lines as (input path, line span or None, index of the first line).
+    A single uncompressed input is not copied: its shards are spans found with the persistent
+    line index, which workers seek to directly. Otherwise the corpus is written as
+    shard_00000.txt, ...
+    """
+    if len(paths) == 1 and _detect_compression(paths[0]) is None:
+        index = LineIndex.open(paths[0])
+        return [(paths[0], index.span(start, start + shard_lines), start)
+                for start in range(0, index.line_count, shard_lines)]
+    os.makedirs(shard_dir, exist_ok=True)
+    shards = []
+    lines = []
+
+    def flush():
+        path = os.path.join(shard_dir, f'shard_{len(shards):05d}.txt')
+        atomic_write(path, (''.join(line + '\n' for line in lines)).encode('utf-8'))
+        shards.append((path, None, len(shards) * shard_lines))
+
+    for line in read_lines(paths):
+        lines.append(line)
+        if len(lines) >= shard_lines:
+            flush()
+            lines = []
+    if lines:
+        flush()
+    return shards
+
+
+class Coordinator:
+    """Shard queue with leases, retries and per-worker throughput bookkeeping"""
+
+    def __init__(self, shards, out_dir, segmenter_kwargs, nbest=0,
+                 lease_timeout=600.0, max_retries=3, log=sys.stderr):
+        self.shards = shards
+        self.outputs = [os.path.join(out_dir, f'out_{i:05d}.txt') for i in range(len(shards))]
+        self.segmenter_kwargs = segmenter_kwargs
+        self.nbest = nbest
+        self.lease_timeout = lease_timeout
+        self.max_retries = max_retries
+        self.log = log
+        self.pending = list(range(len(shards)))
+        self.leases = {}        # shard -> (worker, lease start)
+        self.completed = set()
+        self.failed = {}        # shard -> last error, after max_retries attempts
+        self.attempts = [0] * len(shards)
+        self.worker_stats = {}  # worker -> [lines, seconds, shards]
+        self.lock = threading.Lock()
+        self.finished = threading.Event()
+        self.start_time = time.perf_counter()
+        os.makedirs(out_dir, exist_ok=True)
+        self._check_finished()
+
+    def _requeue(self, shard, error):
+        self.leases.pop(shard, None)
+        if self.attempts[shard] >= self.max_retries:
+            self.failed[shard] = error
+            print(f"[coord] shard {shard} failed permanently: {error}", file=self.log)
+        else:
+            self.pending.insert(0, shard)
+            print(f"[coord] retrying shard {shard} ({error})", file=self.log)
+        self._check_finished()
+
+    def _expire_leases(self):
+        now = time.perf_counter()
+        for shard, (worker, since) in list(self.leases.items()):
+            if now - since > self.lease_timeout:
+                self._requeue(shard, f"lease of worker {worker} timed out")
+
+    def _check_finished(self):
+        if len(self.completed) + len(self.failed) == len(self.shards):
+            self.finished.set()
+
+    def handle(self, msg):
+        op = msg.get('op')
+        worker = msg.get('worker', '?')
+        with self.lock:
+            if op == 'hello':
+                return {'segmenter': self.segmenter_kwargs, 'nbest': self.nbest}
+            if op == 'get':
+                self._expire_leases()
+                if self.finished.is_set():
+                    return {'done': True}
+                if not self.pending:
+                    return {'wait': 0.5}
+                shard = self.pending.pop(0)
+                self.attempts[shard] += 1
+                self.leases[shard] = (worker, time.perf_counter())
+                path, span, first_idx = self.shards[shard]
+                task = {'shard': shard, 'input': path, 'output': self.outputs[shard], 'first_idx': first_idx}
+                if span is not None:
+                    task['span'] = span
+                return task
+            if op == 'complete':
+                shard = msg['shard']
+                if self.leases.get(shard, (None,))[0] != worker:
+                    return {'ok': False}    # lease expired and the shard was handed out again
+                del self.leases[shard]
+                self.completed.add(shard)
+                stats = self.worker_stats.setdefault(worker, [0, 0.0, 0])
+                stats[0] += msg['lines']
+                stats[1] += msg['seconds']
+                stats[2] += 1
+                print(f"[coord] {len(self.completed)}/{len(self.shards)} shards; worker {worker}: "
+                      f"shard {shard} {msg['lines']} lines, {msg['lines'] / max(msg['seconds'], 1e-9):.0f} lines/s",
+                      file=self.log)
+                self._check_finished()
+                return {'ok': True}
+            if op == 'fail':
+                shard = msg['shard']
+                if self.leases.get(shard, (None,))[0] == worker:
+                    self._requeue(shard, msg.get('error', 'worker error'))
+                return {'ok': True}
+            if op == 'disconnect':
+                for shard, (owner, _) in list(self.leases.items()):
+                    if owner == worker:
+                        self._requeue(shard, f"worker {worker} disconnected")
+                return {'ok': True}
+        return {'error': f"unknown op {op!r}"}
+
+    def merge(self, output):
+        import shutil
+        fout = open_text(output, 'w') if output else sys.stdout
+        try:
+            for path in self.outputs:
+                with open(path, encoding='utf-8') as f:
+                    shutil.copyfileobj(f, fout)
+        finally:
+            if output:
+                fout.close()
+
+    def report(self):
+        elapsed = time.perf_counter() - self.start_time
+        total = sum(stats[0] for stats in self.worker_stats.values())
+        print(f"[coord] {len(self.completed)}/{len(self.shards)} shards, {total} lines "
+              f"in {elapsed:.2f}s ({total / max(elapsed, 1e-9):.0f} lines/s)", file=self.log)
+        for worker, (lines, seconds, shards) in sorted(self.worker_stats.items()):
+            print(f"[coord]   worker {worker}: {shards} shards, {lines} lines, "
+                  f"{lines / max(seconds, 1e-9):.0f} lines/s", file=self.log)
+
+
+def serve(coordinator, host, port):
+    """Serve the coordinator protocol on host:port in a background thread; returns the server"""
+    import socketserver
+
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            worker = None
+            try:
+                for raw in self.rfile:
+                    msg = json.loads(raw)
+                    worker = msg.get('worker', worker)
+                    self.wfile.write((json.dumps(coordinator.handle(msg)) + '\n').encode('utf-8'))
+            except (ConnectionError, ValueError):
+                pass
+            finally:
+                if worker is not None:
+                    coordinator.handle({'op': 'disconnect', 'worker': worker})
+
+    class Server(socketserver.ThreadingTCPServer):
+        allow_reuse_address = True
+        daemon_threads = True
+
+    server = Server((host, port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def run_worker(host, port, worker_id=None, log=sys.stderr):
+    """Connect to a coordinator and segment shards until it reports that the job is done"""
+    worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+    with socket.create_connection((host, port)) as sock:
+        stream = sock.makefile('rwb')
+
+        def call(**msg):
+            msg['worker'] = worker_id
+            stream.write((json.dumps(msg) + '\n').encode('utf-8'))
+            stream.flush()
+            reply = stream.readline()
+            if not reply:
+                raise ConnectionError("coordinator closed the connection")
+            return json.loads(reply)
+
+        config = call(op='hello')
+        segmenter = HybridDAGSegmenter(**config['segmenter'])
+        nbest = config.get('nbest', 0)
+        while True:
+            task = call(op='get')
+            if task.get('done'):
+                return
+            if 'wait' in task:
+                time.sleep(task['wait'])
+                continue
+            start = time.perf_counter()
+            try:
+                if 'span' in task:
+                    lines = list(read_line_span(task['input'], *task['span']))
+                else:
+                    lines = list(read_lines([task['input']]))
+                data = ''.join(format_line_output(segmenter, line, idx, nbest) for idx, line in enumerate(lines, task['first_idx']))
+                atomic_write(task['output'], data.encode('utf-8'))
+            except Exception as e:
+                print(f"[worker {worker_id}] shard {task['shard']} failed: {e}", file=log)
+                call(op='fail', shard=task['shard'], error=str(e))
+                continue
+            call(op='complete', shard=task['shard'], lines=len(lines), seconds=time.perf_counter() - start)
+
+
+def _parse_address(value):
+    host, _, port = value.rpartition(':')
+    return host or '127.0.0.1', int(port)
+
+
+def run_coordinator(args, spawn_workers=0):
+    segmenter_kwargs = segmenter_kwargs_from_args(args)
+    paths = expand_input_paths(args.input)
+    shards = split_into_shards(paths, os.path.join(args.work_dir, 'shards'), args.shard_lines)
+    print(f"[coord] {len(shards)} shards of up to {args.shard_lines} lines in {args.work_dir}", file=sys.stderr)
+    coordinator = Coordinator(shards, os.path.join(args.work_dir, 'out'), segmenter_kwargs, nbest=args.nbest,
+                              lease_timeout=args.lease_timeout, max_retries=args.max_retries)
+    host, port = _parse_address(args.bind)
+    server = serve(coordinator, host, port)
+    host, port = server.server_address[:2]
+    print(f"[coord] listening on {host}:{port}", file=sys.stderr)
+
+    procs = []
+    if spawn_workers:
+        import subprocess
+        for i in range(spawn_workers):
+            procs.append(subprocess.Popen([sys.executable, os.path.abspath(__file__), 'worker',
+                                           '--connect', f'{host}:{port}', '--worker-id', f'local-{i}']))
+    try:
+        while not coordinator.finished.wait(1.0):
+            if procs and all(p.poll() is not None for p in procs):
+                print("[coord] all local workers exited before the job finished", file=sys.stderr)
+                break
+    finally:
+        server.shutdown()
+        for p in procs:
+            p.wait()
+
+    coordinator.report()
+    if len(coordinator.completed) != len(shards):
+        missing = sorted(set(range(len(shards))) - coordinator.completed)
+        print(f"[coord] job incomplete, missing shards: {missing}", file=sys.stderr)
+        return 1
+    coordinator.merge(args.output)
+    return 0
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="oppa_cluster, sharded multi-worker driver for oppa_word")
+    sub = parser.add_subparsers(dest='mode', required=True)
+
+    worker = sub.add_parser('worker', help="Segment shards handed out by a coordinator")
+    worker.add_argument('--connect', required=True, help="Coordinator address HOST:PORT")
+    worker.add_argument('--worker-id', help="Worker name in progress reports (default: host-pid)")
+
+    for name, text in [('coordinator', "Split input into shards and serve them to workers"),
+                       ('run', "Coordinator on localhost plus local worker processes")]:
+        p = sub.add_parser(name, help=text)
+        p.add_argument('--input', '-i', required=True, help="Input corpus (compressed files and quoted globs allowed)")
+        p.add_argument('--output', '-o', help="Merged output file (default: stdout)")
+        p.add_argument('--work-dir', required=True, help="Shared directory for shards and shard outputs")
+        p.add_argument('--shard-lines', type=int, default=50000, help="Lines per shard (default: 50000)")
+        p.add_argument('--bind', default='127.0.0.1:0' if name == 'run' else '0.0.0.0:7707',
+                       help="Coordinator address HOST:PORT (port 0 picks a free port)")
+        p.add_argument('--lease-timeout', type=float, default=600.0,
+                       help="Seconds before an unfinished shard is handed to another worker (default: 600)")
+        p.add_argument('--max-retries', type=int, default=3, help="Attempts per shard before giving up (default: 3)")
+        p.add_argument('--nbest', type=int, default=0, help="Write the top-K segmentations per line")
+        if name == 'run':
+            p.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                           help="Number of local worker processes (default: CPU count)")
+        add_model_arguments(p)
+
+    args = parser.parse_args()
+    if args.mode == 'worker':
+        run_worker(*_parse_address(args.connect), worker_id=args.worker_id)
+        return
+    validate_model_arguments(parser, args)
+    if args.shard_lines < 1:
+        parser.error("--shard-lines must be at least 1")
+    sys.exit(run_coordinator(args, spawn_workers=args.workers if args.mode == 'run' else 0))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,3391 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+oppa_core, Hybrid DAG + Bi-MM + LM Myanmar Word Segmenter with Visualization
+(the library behind the oppa_word.py command)
+
+Core Features:
+- DAG construction from dictionary and substrings (configurable length, default: ≤6 syllables)
+- Bi-directional Maximum Matching (Bi-MM) fallback path
+- Multi-feature scoring: Dictionary weight, syllable frequency, and ARPA/binary LM
+- Advanced post-editing with regex and string replacement rules
+- Configurable boosting for Bi-MM paths
+- Integrated smart space removal with Myanmar-specific modes
+- Punctuation-aware segmentation (၊ ။)
+
+Optional Features:
+- DAG visualization (.dot + .pdf with Graphviz)
+- Binary LM support (KenLM format)
+- Adjustable max n-gram order for LM scoring
+- Lazy resource loading with startup timing report (--startup-report)
+- Parallel chunked loading of large ARPA and frequency files (--load-workers)
+- N-best segmentations with lazy k-best Viterbi (--nbest) and JSON-lines lattice output
+- Beam/histogram-pruned decoding with LM state recombination (--beam, --max-states-per-node,
+  --max-edges-per-node)
+- Incremental segmentation API for live typing (IncrementalSegmenter)
+- JSONL and Parquet corpus I/O with optional token character offsets (--format, --offsets)
+- Transparent gzip/bz2/xz/zstd input and output, streamed with background decompression
+- Sharded input globs (e.g. 'part-*.gz'), processed in order or in parallel (--shard-workers)
+- Resumable, checkpointed chunk jobs with a checksum manifest (--job-dir)
+- Thread-safe segmenter with a thread-pool batch mode (--threads, segment_batch)
+- asyncio API with micro-batching, bounded concurrency, cancellation and timeouts (AsyncSegmenter)
+- Adaptive request coalescing with de-duplication and latency/batch-size histograms (BatchingSegmenter)
+- Hot reload of dictionary, syllable frequency and post-rule files (reload, ResourceWatcher, --watch-resources)
+- Runtime add_words()/remove_words() and copy-on-write per-tenant dictionary overlays (tenant())
+- Prometheus metrics, written to a file or served over HTTP (SegmenterMetrics, --metrics-file, --metrics-port)
+- Bounded LRU cache for KenLM queries (opt-in for ARPA models), shared or per thread, with hit statistics (--lm-cache-size, --lm-cache-scope)
+- Shadow mode comparing a candidate engine with the reference on sampled lines (ShadowSegmenter, --shadow)
+- Optional numba JIT Viterbi kernel over flat edge arrays, with automatic fallback (--engine numba)
+- Persistent line-offset index for random access to line ranges and byte-balanced shards (--lines)
+- One-pass dictionary, non-dictionary and Bi-MM-edge word counts, mergeable across workers (WordStats, --word-stats)
+- Fused single-pass text pipeline (space removal, segmentation, post-rules, punctuation spacing, custom
+  callables) with per-stage timing (TextPipeline, --pipeline, --pipeline-timing)
+- Slow-line capture: the N slowest lines with DAG size, LM queries and stage timings, optionally with
+  their DAGs rendered (SlowLineCapture, --slow-lines)
+
+Author: Ye Kyaw Thu, LU Lab., Myanmar
+Date: 22 July 2025
+Last Update: 26 July 2025
+"""
+
+import time
+_IMPORT_START = time.perf_counter()
+
+import re
+import os
+import sys
+import math
+import heapq
+import bisect
+import threading
+from itertools import accumulate
+from collections import Counter, defaultdict, namedtuple
+
+# argparse, subprocess and kenlm are imported where they are first needed,
+# so dictionary-only runs do not pay for them at startup.
+IMPORT_TIME = time.perf_counter() - _IMPORT_START
+
+# === Unicode Character Classes for Space Removal ===
+MYANMAR_LETTER = r'[\u1000-\u109F\uAA60-\uAA7F]'
+MYANMAR_DIGIT = r'[\u1040-\u1049]'
+
+# === Regex Patterns for Space Removal ===
+RE_MM_LETTER_SPACE = re.compile(rf'({MYANMAR_LETTER})\s+({MYANMAR_LETTER})')
+RE_MM_DIGIT_DIGIT = re.compile(rf'({MYANMAR_DIGIT})\s+({MYANMAR_DIGIT})')
+RE_MM_DIGIT_LETTER = re.compile(rf'({MYANMAR_DIGIT})\s+({MYANMAR_LETTER})')
+RE_MM_LETTER_DIGIT = re.compile(rf'({MYANMAR_LETTER})\s+({MYANMAR_DIGIT})')
+
+PROTECT_SPACES = [
+    (RE_MM_DIGIT_DIGIT, r'\1☃\2'),           # protect digit-digit
+    (RE_MM_DIGIT_LETTER, r'\1☃\2'),          # protect digit-letter
+    (RE_MM_LETTER_DIGIT, r'\1☃\2'),          # protect letter-digit
+]
+
+# Space before ၊ and ။ (as tools/correct_my_punc.py)
+RE_PUNC_NO_SPACE = re.compile(r'(\S)([၊။])')
+
+# Syllable boundary: a consonant not after a virama and not followed by asat/virama, or a punctuation mark
+RE_SYLLABLE_BREAK = re.compile(r"((?<!္)([က-အ]|၊|။)(?![်္]))")
+
+SPACE_REMOVE_MODES = ('all', 'my', 'my_not_num')
+
+
+# === Text Helpers (no resources needed) ===
+def remove_all_spaces(text):
+    return text.replace(' ', '')
+
+
+def remove_myanmar_spaces(text, preserve_digits=False):
+    if preserve_digits:
+        for pattern, replacement in PROTECT_SPACES:
+            text = pattern.sub(replacement, text)
+
+    prev = None
+    while prev != text:
+        prev = text
+        text = RE_MM_LETTER_SPACE.sub(r'\1\2', text)
+
+    if preserve_digits:
+        text = text.replace('☃', ' ')
+
+    return text
+
+
+def remove_spaces(text, mode):
+    """Space removal for a --space-remove-mode (one of SPACE_REMOVE_MODES)"""
+    if mode == 'all':
+        return remove_all_spaces(text)
+    elif mode == 'my':
+        return remove_myanmar_spaces(text, preserve_digits=False)
+    elif mode == 'my_not_num':
+        return remove_myanmar_spaces(text, preserve_digits=True)
+    return text
+
+
+def syllable_break(text):
+    text = re.sub(r'\s+', ' ', text.strip())
+    result = RE_SYLLABLE_BREAK.sub(r'|\1', text)
+    if result.startswith('|'):
+        result = result[1:]
+    return result.split('|')
+
+
+def load_post_rules(rule_file):
+    """('regex', pattern, target) and ('string', source, target) rules of a WRONG|||CORRECT file"""
+    rules = []
+    with open(rule_file, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            if '|||' in line:
+                src, tgt = line.split('|||', 1)
+                src = src.strip()
+                tgt = tgt.strip()
+                
+                # Check if source is a regex pattern (contains special chars)
+                if any(char in src for char in '()[]{}.*+?^$\\|'):
+                    try:
+                        # Compile as regex pattern
+                        pattern = re.compile(src)
+                        rules.append(('regex', pattern, tgt))
+                    except re.error:
+                        print(f"Warning: Invalid regex pattern '{src}' - skipping", file=sys.stderr)
+                else:
+                    # Treat as normal string replacement
+                    rules.append(('string', src, tgt))
+    return rules
+
+
+def apply_post_rules(line, rules):
+    for rule_type, src, tgt in rules:
+        if rule_type == 'regex':
+            line = src.sub(tgt, line)
+        else:
+            line = line.replace(src, tgt)
+    return line
+
+
+def correct_segmentation(text):
+    """Add a space before ၊ and ။ (the tools/correct_my_punc.py stage)"""
+    return RE_PUNC_NO_SPACE.sub(r'\1 \2', text)
+
+
+# === Parallel Chunked Loading (ARPA LM and syllable frequency files) ===
+PARALLEL_LOAD_MIN_BYTES = 8 * 1024 * 1024   # smaller files are parsed serially
+
+
+def _chunk_offsets(path, num_chunks, section_marker=None):
+    """Split a file into (start, end) byte ranges that end on line boundaries.
+    If section_marker is given (e.g. b'-grams:' for ARPA), section headers also start new chunks."""
+    import mmap
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        size = len(mm)
+        cuts = {0, size}
+        if section_marker:
+            pos = mm.find(section_marker)
+            while pos != -1:
+                cuts.add(mm.rfind(b'\n', 0, pos) + 1)
+                pos = mm.find(section_marker, pos + 1)
+        step = max(1, size // max(1, num_chunks))
+        for target in range(step, size, step):
+            newline = mm.find(b'\n', target)
+            if newline != -1:
+                cuts.add(newline + 1)
+    cuts = sorted(c for c in cuts if c <= size)
+    return [(a, b) for a, b in zip(cuts, cuts[1:]) if b > a]
+
+
+def _read_chunk(path, start, end):
+    import mmap
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        return mm[start:end].decode('utf-8')
+
+
+def _arpa_order(path):
+    """Highest n-gram order declared in an ARPA header (0 if there is none)"""
+    order = 0
+    with open(path, encoding='utf-8', errors='replace') as f:
+        for line in f:
+            line = line.strip()
+            if line.startswith('ngram ') and '=' in line:
+                try:
+                    order = max(order, int(line[6:].split('=')[0]))
+                except ValueError:
+                    continue
+            elif line.endswith('-grams:'):
+                break
+    return order
+
+
+def _parse_arpa_chunk(args):
+    """Parse one byte range of an ARPA file into (newline-joined n-grams, array of their logprobs)"""
+    from array import array
+    path, start, end = args
+    ngrams = []
+    logprobs = array('d')
+    for line in _read_chunk(path, start, end).splitlines():
+        parts = line.strip().split('\t')
+        if len(parts) >= 2 and not parts[0].startswith('\\'):
+            try:
+                logprob = float(parts[0])
+            except ValueError:
+                continue
+            ngrams.append(parts[1])
+            logprobs.append(logprob)
+    return '\n'.join(ngrams), logprobs
+
+
+def _parse_freq_chunk(args):
+    """Parse one byte range of a frequency file into (newline-joined syllables, array of their counts)"""
+    from array import array
+    path, start, end = args
+    freq = _parse_freq_text(_read_chunk(path, start, end))
+    return '\n'.join(freq), array('q', freq.values())
+
+
+def _parse_freq_text(text):
+    freq = {}
+    for line in text.splitlines():
+        parts = line.strip().split('\t')
+        if len(parts) == 2:
+            syl, count = parts if not parts[0].isdigit() else (parts[1], parts[0])
+            try:
+                freq[syl] = int(count)
+            except ValueError:
+                continue
+    return freq
+
+
+def parallel_load(path, parse_chunk, workers, section_marker=None, progress=False, name='file'):
+    """
+    Parse a large file in a process pool and merge the chunk results into one dict, in
+    file order. Workers return each chunk as one newline-joined key string and an array of
+    values, which pickle as two flat buffers instead of a dict of small objects.
+
+    Building the final dict in the parent stays serial, so the speedup is bounded. On a
+    94 MB ARPA file with 1.3M entries, the serial parse takes 2.3-2.7 s. The parent's
+    share is 0.9-1.06 s; it was 1.04-1.41 s when workers returned dicts. The load
+    therefore cannot drop below about 1 s, a ceiling of about 2.5x whatever the number
+    of workers.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    chunks = _chunk_offsets(path, workers * 4, section_marker)
+    result = {}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for done, (keys, values) in enumerate(pool.map(parse_chunk, [(path, a, b) for a, b in chunks]), 1):
+            result.update(zip(keys.split('\n'), values))
+            if progress:
+                print(f"\r[load] {name}: {done}/{len(chunks)} chunks", end='', file=sys.stderr)
+    if progress:
+        print(file=sys.stderr)
+    return result
+
+
+# === JIT Decoding Kernel (optional, numba) ===
+ENGINES = ('python', 'numba')
+_jit_kernel = None
+
+
+def _numba_viterbi_kernel():
+    """Compiled DAG relaxation for engine='numba', or None if numba/numpy are not installed"""
+    global _jit_kernel
+    if _jit_kernel is None:
+        try:
+            import numba
+        except ImportError:
+            print("Warning: numba is not installed (pip install numba); using the Python engine",
+                  file=sys.stderr)
+            _jit_kernel = False
+            return None
+
+        @numba.njit(cache=True, nogil=True)
+        def viterbi_kernel(n, starts, ends, scores):
+            # Edges come grouped by ascending start node, as in the Python loop, so
+            # ties and float sums resolve identically. Returns the best incoming edge per node.
+            best = np.full(n + 1, -np.inf)
+            back = np.full(n + 1, -1, dtype=np.int64)
+            best[0] = 0.0
+            for e in range(starts.shape[0]):
+                i = starts[e]
+                j = ends[e]
+                total = best[i] + scores[e]
+                if best[j] < total:
+                    best[j] = total
+                    back[j] = e
+            return back
+
+        import numpy as np
+        _jit_kernel = viterbi_kernel
+    return _jit_kernel or None
+
+
+# === LM Query Cache ===
+LM_CACHE_SIZE = 100000
+
+
+def _is_binary_lm(path):
+    """True for a KenLM binary model path (loaded with kenlm rather than parsed as ARPA)"""
+    return bool(path) and path.endswith(('.bin', '.klm'))
+
+
+class LMCache:
+    """
+    Bounded LRU cache of LM scores keyed by (context tuple, word), for both the ARPA dict
+    and the KenLM backend, built on functools.lru_cache. HybridDAGSegmenter only enables
+    it by default for KenLM: for an ARPA dict, building the key costs more than the
+    probes it saves (decoding 5000 lines of data/10k_test with a 3-gram ARPA model took
+    0.90-1.10 s without and 1.11-1.24 s with the cache, at a 27% hit rate).
+
+    scope='process' shares `shards` LRU maps between all threads (entries are spread by
+    word; more than one shard only pays off on free-threaded builds, so that is the
+    default there); scope='thread' gives every thread a private LRU of the same total
+    size. stats() returns (hits, misses).
+    """
+
+    def __init__(self, maxsize=LM_CACHE_SIZE, shards=None, scope='process'):
+        import weakref
+        if scope not in ('process', 'thread'):
+            raise ValueError(f"unknown LM cache scope: {scope}")
+        if shards is None:
+            shards = 1 if getattr(sys, '_is_gil_enabled', lambda: True)() else 8
+        self.maxsize = maxsize
+        self.scope = scope
+        self.shards = max(1, shards) if scope == 'process' else 1
+        self._caches = []
+        self._thread_caches = weakref.WeakSet()   # live _ThreadCache holders, one per thread
+        self._retired = [0, 0]                    # hits and misses of the caches of finished threads
+        self._registry_lock = threading.RLock()   # reentrant: a holder may be freed while it is held
+
+    def bind(self, query):
+        """Return a cached version of query(context, word)"""
+        import functools
+        shard_size = max(1, self.maxsize // self.shards)
+        if self.scope == 'thread':
+            local = threading.local()
+
+            def lookup(context, word):
+                holder = getattr(local, 'holder', None)
+                if holder is None:
+                    # the holder lives in the thread's local storage, so it is freed when the thread ends
+                    holder = local.holder = _ThreadCache(self, functools.lru_cache(shard_size)(query))
+                    with self._registry_lock:
+                        self._thread_caches.add(holder)
+                return holder.cached(context, word)
+            return lookup
+        caches = [functools.lru_cache(shard_size)(query) for _ in range(self.shards)]
+        with self._registry_lock:
+            self._caches.extend(caches)
+        if len(caches) == 1:
+            return caches[0]
+        shards = len(caches)
+        return lambda context, word: caches[hash(word) % shards](context, word)
+
+    def _live_caches(self):
+        with self._registry_lock:
+            return self._caches + [holder.cached for holder in self._thread_caches]
+
+    def _retire(self, cached):
+        info = cached.cache_info()
+        with self._registry_lock:
+            self._retired[0] += info.hits
+            self._retired[1] += info.misses
+
+    def clear(self):
+        for cached in self._live_caches():
+            cached.cache_clear()
+
+    def stats(self):
+        infos = [cached.cache_info() for cached in self._live_caches()]
+        return self._retired[0] + sum(i.hits for i in infos), self._retired[1] + sum(i.misses for i in infos)
+
+    def __len__(self):
+        return sum(cached.cache_info().currsize for cached in self._live_caches())
+
+
+class _ThreadCache:
+    """One thread's LRU of a thread-scoped LMCache; adds its hit counts to the cache's totals when freed"""
+    __slots__ = ('owner', 'cached', '__weakref__')
+
+    def __init__(self, owner, cached):
+        self.owner = owner
+        self.cached = cached
+
+    def __del__(self):
+        self.owner._retire(self.cached)
+
+
+class HybridDAGSegmenter:
+    """
+    Thread-safety: once loaded, the model state (dictionary, syllable frequencies, LM,
+    post-rules) is only read, and segment(), segment_nbest() and lattice() keep all
+    scratch state in locals, so one instance can be shared by many threads. Resource
+    loading is guarded by a lock. Use segment_batch(threads=N) for a thread pool; on
+    free-threaded CPython (3.13t+) this scales across cores without copying the LM.
+    IncrementalSegmenter objects hold per-text state and are not shared.
+    """
+
+    def __init__(self, dict_path, syl_freq_path=None, arpa_lm_path=None,
+                 max_order=5, dict_weight=10.0, postrule_file=None,
+                 use_bimm_fallback=False, bimm_boost=0.0,
+                 visualize_dag=False, dag_output_dir='dag_viz',
+                 space_remove_mode=None, max_word_len=6,
+                 load_workers=1, load_progress=False,
+                 beam=None, max_edges_per_node=None, max_states_per_node=None,
+                 lm_cache_size=None, lm_cache_scope='process', engine='python'):
+        # Resources are loaded lazily on first use (see the properties below)
+        self.dict_path = dict_path
+        self.syl_freq_path = syl_freq_path
+        self.arpa_lm_path = arpa_lm_path
+        self.postrule_file = postrule_file
+        self._word_dict = None
+        self._syl_freq = None
+        self._lm = None
+        self._post_rules = None
+        self._loaded = False
+        self._use_lm = False
+        self._lm_key_len = None
+        self._syl_log = (None, {})
+        self.load_times = {}
+        self.metrics = None
+        self.slow_lines = None
+        self.word_stats = None
+        self.dict_version = 0
+        self.resource_version = 0
+        self._runtime_added = frozenset()
+        self._runtime_removed = frozenset()
+        self._tenant_of = None
+        self._file_states = {}
+        self._load_lock = threading.RLock()
+        self.load_workers = load_workers
+        self.load_progress = load_progress
+        self.max_order = max_order
+        self.max_word_len = max(3, min(12, max_word_len))  # Enforce 3-12 range
+        self.unk_logprob = -20.0
+        self.break_pattern = RE_SYLLABLE_BREAK
+        self.dict_weight = dict_weight
+        self.use_bimm_fallback = use_bimm_fallback
+        self.bimm_boost = bimm_boost
+        self.visualize_dag = visualize_dag
+        self.dag_output_dir = dag_output_dir
+        self.space_remove_mode = space_remove_mode
+        self.beam = beam
+        self.max_edges_per_node = max_edges_per_node
+        self.max_states_per_node = max_states_per_node
+        if engine not in ENGINES:
+            raise ValueError(f"unknown engine: {engine} (choose from {', '.join(ENGINES)})")
+        self.engine = engine
+        self.lm_cache = None
+        self._lm_lookup = None
+        if lm_cache_size is None:
+            # ARPA lookups are a few dict probes, cheaper than building a cache key; KenLM queries are not
+            lm_cache_size = LM_CACHE_SIZE if _is_binary_lm(arpa_lm_path) else 0
+        if lm_cache_size > 0:
+            self.lm_cache = LMCache(lm_cache_size, scope=lm_cache_scope)
+            self._lm_lookup = self.lm_cache.bind(lambda context, word: self._query_lm(list(context), word))
+        if self.visualize_dag:
+            os.makedirs(self.dag_output_dir, exist_ok=True)
+
+    # === Lazily loaded resources ===
+    def _timed_load(self, name, loader, path):
+        if name in self._reloadable():
+            # only size and mtime here; the content hash is taken once reloads are watched
+            st = os.stat(path)
+            self._file_states[name] = {'size': st.st_size, 'mtime_ns': st.st_mtime_ns}
+        start = time.perf_counter()
+        resource = loader(path)
+        self.load_times[name] = time.perf_counter() - start
+        return resource
+
+    def _lazy(self, attr, name, loader, path, default):
+        """Load a resource once; the lock keeps concurrent first calls from loading it twice"""
+        value = getattr(self, attr)
+        if value is None:
+            with self._load_lock:
+                value = getattr(self, attr)
+                if value is None:
+                    value = self._timed_load(name, loader, path) if path else default
+                    setattr(self, attr, value)
+        return value
+
+    @property
+    def word_dict(self):
+        return self._lazy('_word_dict', 'dict', self._load_dict, self.dict_path, frozenset())
+
+    @word_dict.setter
+    def word_dict(self, value):
+        self._word_dict = value
+        self.resource_version += 1
+
+    @property
+    def syl_freq(self):
+        return self._lazy('_syl_freq', 'sylfreq', self._load_freq, self.syl_freq_path, {})
+
+    @syl_freq.setter
+    def syl_freq(self, value):
+        self._syl_freq = value
+        self.resource_version += 1
+
+    @property
+    def lm(self):
+        return self._lazy('_lm', 'lm', self._load_lm, self.arpa_lm_path, {})
+
+    @lm.setter
+    def lm(self, value):
+        self._lm = value
+        self.resource_version += 1
+        self._use_lm = self.has_lm
+        self._lm_key_len = None
+        if self.lm_cache is not None:
+            self.lm_cache.clear()
+
+    @property
+    def has_lm(self):
+        """True if LM scoring is enabled, without forcing the LM to load"""
+        if self._lm is None:
+            return bool(self.arpa_lm_path)
+        return not isinstance(self._lm, dict) or bool(self._lm)
+
+    @property
+    def post_rules(self):
+        return self._lazy('_post_rules', 'postrules', load_post_rules, self.postrule_file, [])
+
+    @post_rules.setter
+    def post_rules(self, value):
+        self._post_rules = value
+        self.resource_version += 1
+
+    def preload(self):
+        """Load every configured resource now instead of on first use"""
+        resources = self.word_dict, self.syl_freq, self.lm, self.post_rules
+        self._syl_log_table()
+        self._use_lm = self.has_lm
+        self._loaded = True
+        return resources
+
+    # === Hot reload ===
+    def _reloadable(self):
+        """name -> (path attribute, resource attribute, loader, extend(old, appended_text) or None)"""
+        return {
+            'dict': ('dict_path', '_word_dict', self._load_dict,
+                     lambda old, tail: old | frozenset(w.strip() for w in tail.splitlines() if w.strip())),
+            'sylfreq': ('syl_freq_path', '_syl_freq', self._load_freq,
+                        lambda old, tail: {**old, **_parse_freq_text(tail)}),
+            'postrules': ('postrule_file', '_post_rules', load_post_rules, None),
+        }
+
+    def reload(self, force=False):
+        """
+        Re-read the dictionary, syllable frequency and post-rule files that changed on disk,
+        build the new structures while the old ones keep serving, then swap them in with a
+        single assignment, so no request is dropped. If a file only had lines appended, only
+        the appended part is parsed and merged into the old structure. Resources that were
+        never loaded are skipped (they will be read fresh on first use). Words added or
+        removed with add_words()/remove_words() are re-applied to a reloaded dictionary.
+        Returns the names of the reloaded resources.
+        """
+        if self._tenant_of is not None:
+            return self._tenant_of.reload(force)
+        self._fingerprint_files()
+        reloaded = []
+        for name, (path_attr, attr, loader, extend) in self._reloadable().items():
+            path = getattr(self, path_attr)
+            old = getattr(self, attr)
+            if not path or old is None:
+                continue
+            old_state = self._file_states.get(name)
+            st = os.stat(path)
+            if not force and old_state and (st.st_size, st.st_mtime_ns) == (old_state['size'], old_state['mtime_ns']):
+                continue
+            start = time.perf_counter()
+            hashed = old_state is not None and 'sha1' in old_state
+            state = _file_fingerprint(path, prefix_len=old_state['size'] if hashed else None)
+            if not force and hashed and state['sha1'] == old_state['sha1']:
+                self._file_states[name] = state
+                continue
+            if (extend and not force and hashed and old_state['newline_end']
+                    and state['size'] > old_state['size'] and state['prefix_sha1'] == old_state['sha1']):
+                with open(path, 'rb') as f:
+                    f.seek(old_state['size'])
+                    new = extend(old, f.read().decode('utf-8'))
+                mode = 'appended'
+            else:
+                new = loader(path)
+                mode = 'full'
+            with self._load_lock:
+                if name == 'dict':
+                    new = (new - self._runtime_removed) | self._runtime_added
+                    self.dict_version += 1
+                setattr(self, attr, new)
+                self.resource_version += 1
+                self._file_states[name] = state
+            if name == 'sylfreq':
+                self._syl_log_table()
+            del old, new
+            self.load_times[f'reload {name} ({mode})'] = time.perf_counter() - start
+            reloaded.append(name)
+        return reloaded
+
+    def _fingerprint_files(self):
+        """
+        Hash the loaded resource files that are unchanged since loading, so reload() can
+        merge appended lines and skip files that were only touched. Done when a
+        ResourceWatcher starts or on the first reload(), not at load time; a file that
+        changed before it was hashed is reloaded in full.
+        """
+        if self._tenant_of is not None:
+            return self._tenant_of._fingerprint_files()
+        start = time.perf_counter()
+        hashed = False
+        for name, (path_attr, _, _, _) in self._reloadable().items():
+            state = self._file_states.get(name)
+            if state is None or 'sha1' in state:
+                continue
+            path = getattr(self, path_attr)
+            st = os.stat(path)
+            if (st.st_size, st.st_mtime_ns) == (state['size'], state['mtime_ns']):
+                self._file_states[name] = _file_fingerprint(path)
+                hashed = True
+        if hashed:
+            self.load_times['fingerprint'] = time.perf_counter() - start
+
+    # === Runtime dictionary updates ===
+    def add_words(self, words):
+        """Add words to the dictionary at runtime; they survive hot reloads of the dictionary file"""
+        words = frozenset(w.strip() for w in words if w and w.strip())
+        self._ensure_loaded()
+        with self._load_lock:
+            if self._tenant_of is not None:
+                added, removed = self._word_dict.words
+                self._word_dict.words = (added | words, removed - words)
+            else:
+                self._runtime_added = self._runtime_added | words
+                self._runtime_removed = self._runtime_removed - words
+                # copy-on-write: readers keep the old frozenset until this single assignment
+                self._word_dict = self._word_dict | words
+            self.dict_version += 1
+
+    def remove_words(self, words):
+        """Remove words from the dictionary at runtime; they stay removed across hot reloads"""
+        words = frozenset(w.strip() for w in words if w and w.strip())
+        self._ensure_loaded()
+        with self._load_lock:
+            if self._tenant_of is not None:
+                added, removed = self._word_dict.words
+                self._word_dict.words = (added - words, removed | words)
+            else:
+                self._runtime_removed = self._runtime_removed | words
+                self._runtime_added = self._runtime_added - words
+                self._word_dict = self._word_dict - words
+            self.dict_version += 1
+
+    def tenant(self, add=(), remove=()):
+        """
+        A segmenter view for one tenant or request: it shares every loaded structure (LM,
+        frequencies, rules and the base dictionary) with this segmenter and keeps only
+        its own added/removed words in a WordOverlay. Updates of the base segmenter,
+        including hot reloads, are visible through the view.
+        """
+        import copy
+        self._ensure_loaded()
+        view = copy.copy(self)
+        view._tenant_of = self
+        view._word_dict = WordOverlay(self, add, remove)
+        view.dict_version = 0
+        return view
+
+    def _dict_stamp(self):
+        """
+        Changes whenever a dictionary lookup or a syllable, LM or rule score may answer
+        differently (for callers caching DAG edges and path scores)
+        """
+        base = self._tenant_of
+        if base is not None:
+            return (base.dict_version, base.resource_version, self.dict_version, self.resource_version)
+        return (self.dict_version, self.resource_version)
+
+    def _ensure_loaded(self):
+        # Decoding reads the underscored attributes directly; the properties are too slow for inner loops
+        if not self._loaded:
+            self.preload()
+        base = self._tenant_of
+        if base is not None and (self._syl_freq is not base._syl_freq or self._lm is not base._lm
+                                 or self._post_rules is not base._post_rules):
+            # a tenant view follows hot reloads of the shared resources
+            self._syl_freq, self._lm, self._post_rules = base._syl_freq, base._lm, base._post_rules
+            self._use_lm = base._use_lm
+            self._syl_log = base._syl_log
+
+    def _load_dict(self, path):
+        with open(path, encoding='utf-8') as f:
+            return frozenset(line.strip() for line in f if line.strip())
+
+    def segment_batch(self, lines, threads=1, start_idx=0, executor=None):
+        """Segment a list of lines, in input order, on a pool of `threads` threads (or a given executor)"""
+        if executor is None and threads <= 1:
+            return [self.segment(line, start_idx + i) for i, line in enumerate(lines)]
+        self.preload()
+        if executor is not None:
+            return list(executor.map(self.segment, lines, range(start_idx, start_idx + len(lines))))
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            return list(pool.map(self.segment, lines, range(start_idx, start_idx + len(lines))))
+
+    def _use_parallel_load(self, path):
+        return self.load_workers > 1 and os.path.getsize(path) >= PARALLEL_LOAD_MIN_BYTES
+
+    def _load_freq(self, path):
+        if self._use_parallel_load(path):
+            return parallel_load(path, _parse_freq_chunk, self.load_workers,
+                                 progress=self.load_progress, name='sylfreq')
+        freq = {}
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                parts = line.strip().split('\t')
+                if len(parts) == 2:
+                    try:
+                        syl, count = parts if not parts[0].isdigit() else (parts[1], parts[0])
+                        freq[syl] = int(count)
+                    except:
+                        continue
+        return freq
+
+    def _load_lm(self, path):
+        """Load LM from either ARPA or binary format"""
+        if _is_binary_lm(path):
+            try:
+                import kenlm
+            except ImportError:
+                raise ImportError("kenlm package required for binary LM support. Install with: pip install kenlm")
+            return kenlm.Model(path)
+        else:
+            return self._load_arpa_lm(path)
+
+    def _load_arpa_lm(self, path):
+        """Load ARPA format LM (updated to handle binary detection)"""
+        # Check if this is actually a binary file
+        with open(path, 'rb') as f:
+            if f.read(2) == b'\x00\x00':  # Simple binary detection
+                raise ValueError("File appears to be binary. Use .bin extension for binary LMs")
+        self._lm_key_len = min(self.max_order, _arpa_order(path) or self.max_order) - 1
+
+        if self._use_parallel_load(path):
+            return parallel_load(path, _parse_arpa_chunk, self.load_workers, section_marker=b'-grams:',
+                                 progress=self.load_progress, name='lm')
+
+        lm = {}
+        current_order = 0
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if line.startswith("\\") and "-grams:" in line:
+                    try:
+                        order_str = line.strip('\\').split('-')[0]
+                        current_order = int(order_str)
+                    except ValueError:
+                        current_order = 0
+                    continue
+                if not line or line.startswith("\\") or line == "\\end\\":
+                    continue
+                parts = line.split('\t')
+                if len(parts) >= 2:
+                    try:
+                        logprob = float(parts[0])
+                        ngram = parts[1]
+                        lm[ngram] = logprob
+                    except ValueError:
+                        continue
+        return lm
+
+    def syllable_break(self, text):
+        return syllable_break(text)
+
+    def _get_lm_score(self, history, word):
+        lookup = self._lm_lookup
+        if lookup is None:
+            return self._query_lm(history, word)
+        n = self._lm_key_len
+        if n is None:
+            # KenLM scores this whole slice
+            return lookup(tuple(history[-self.max_order+1:]), word)
+        # ARPA backoff never looks further back than the model order
+        return lookup(tuple(history[-n:]) if n else (), word)
+
+    def _query_lm(self, history, word):
+        """Updated to handle both dict and kenlm.Model"""
+        lm = self._lm
+        if isinstance(lm, dict):
+            # Original ARPA dict lookup; n-grams longer than the model order cannot match
+            max_context = self.max_order - 1 if self._lm_key_len is None else self._lm_key_len
+            for n in range(min(len(history), max_context), -1, -1):
+                ngram = ' '.join(history[-n:] + [word]) if n > 0 else word
+                if ngram in lm:
+                    return lm[ngram]
+            return self.unk_logprob
+        else:
+            # KenLM binary model
+            context = ' '.join(history[-self.max_order+1:] + [word])
+            return lm.score(context, bos=False, eos=False)
+
+    def _syl_log_table(self):
+        """{syllable: log(count)} for the current frequency table, rebuilt when the table is swapped"""
+        source, table = self._syl_log
+        syl_freq = self._syl_freq
+        if source is not syl_freq:
+            table = {syl: math.log(count) for syl, count in (syl_freq or {}).items() if count > 0}
+            self._syl_log = (syl_freq, table)
+        return table
+
+    def _syl_prefix(self, syllables, start=0, initial=0.0):
+        """
+        Prefix sums of syllable log-frequencies: the span [i, j) scores (p[j] - p[i]) / (j - i).
+        With start, returns p[start:] for a known p[start] = initial.
+        """
+        if not self._syl_freq:
+            return [initial] * (len(syllables) - start + 1)
+        get = self._syl_log_table().get
+        return list(accumulate((get(syllables[i], 0.0) for i in range(start, len(syllables))), initial=initial))
+
+    def _get_dict_score(self, word):
+        return self.dict_weight if word in self._word_dict else 0.0
+
+    def _forward_mm(self, syllables):
+        word_dict = self._word_dict
+        result = []
+        i = 0
+        while i < len(syllables):
+            for j in range(min(self.max_word_len, len(syllables) - i), 0, -1):
+                word = ''.join(syllables[i:i + j])
+                if word in word_dict:
+                    result.append((i, i + j, word))
+                    i += j
+                    break
+            else:
+                result.append((i, i + 1, syllables[i]))
+                i += 1
+        return result
+
+    def _backward_mm(self, syllables):
+        word_dict = self._word_dict
+        result = []
+        i = len(syllables)
+        while i > 0:
+            for j in range(min(self.max_word_len, i), 0, -1):
+                word = ''.join(syllables[i - j:i])
+                if word in word_dict:
+                    result.insert(0, (i - j, i, word))
+                    i -= j
+                    break
+            else:
+                result.insert(0, (i - 1, i, syllables[i - 1]))
+                i -= 1
+        return result
+
+    def _get_bimm_segmentation(self, syllables):
+        fmm = self._forward_mm(syllables)
+        bmm = self._backward_mm(syllables)
+        return fmm if len(fmm) <= len(bmm) else bmm
+
+    def _visualize_dag(self, dag_edges, syllables, line_idx):
+        import subprocess
+        dot_lines = ['digraph DAG {']
+        dot_lines.append('  rankdir=LR;')
+        for start, edges in dag_edges.items():
+            for end, word, score, is_bimm in edges:
+                label = f"{word} ({score:.1f}){'*' if is_bimm else ''}"
+                dot_lines.append(f'  {start} -> {end} [label="{label}"];')
+        dot_lines.append('}')
+        dot_path = os.path.join(self.dag_output_dir, f'dag_line_{line_idx:04d}.dot')
+        pdf_path = dot_path.replace('.dot', '.pdf')
+        with open(dot_path, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(dot_lines))
+        subprocess.run(['dot', '-Tpdf', dot_path, '-o', pdf_path])
+
+    def _preprocess_text(self, text):
+        return remove_spaces(text, self.space_remove_mode) if self.space_remove_mode else text
+
+    def _build_dag(self, syllables):
+        """Dictionary/single-syllable edges plus the optional Bi-MM path: dag[i] = [(j, word, is_bimm), ...]"""
+        n = len(syllables)
+        dag = defaultdict(list)
+        word_dict = self._word_dict
+
+        for i in range(n):
+            for j in range(i + 1, min(i + self.max_word_len + 1, n + 1)):
+                word = ''.join(syllables[i:j])
+                if word in word_dict or j - i == 1:
+                    dag[i].append((j, word, False))
+
+        # Add Bi-MM fallback path
+        if self.use_bimm_fallback:
+            bimmpath = self._get_bimm_segmentation(syllables)
+            for start, end, word in bimmpath:
+                dag[start].append((end, word, True))
+        return dag
+
+    def _edge_score(self, history, word, is_bimm, syl_score=0.0):
+        total = self._get_dict_score(word) + syl_score
+        if self._use_lm:
+            total += self._get_lm_score(history, word)
+        if is_bimm:
+            total += self.bimm_boost
+        return total
+
+    def _score_dag_edges(self, dag, n, prefix):
+        """Context-free edge scores (empty LM history), as shown in DAG visualizations and lattices"""
+        scored = defaultdict(list)
+        for i in range(n):
+            for j, word, is_bimm in dag[i]:
+                syl_score = (prefix[j] - prefix[i]) / (j - i)
+                scored[i].append((j, word, self._edge_score([], word, is_bimm, syl_score), is_bimm))
+        return scored
+
+    def _finalize(self, words):
+        segmented = ' '.join(words)
+        segmented = re.sub(r'\s+', ' ', segmented.strip())  # to normalize spaces
+        return apply_post_rules(segmented, self._post_rules) if self._post_rules else segmented
+
+    def _beam_decode(self, dag, n, prefix):
+        """
+        Beam-pruned decoding with LM state recombination.
+        Hypotheses at a node are merged when they share the last (max_order - 1) words,
+        which is all the LM can see. Only the best max_states_per_node hypotheses at a
+        node are expanded (histogram pruning), and of those only the ones within `beam`
+        of the best; each takes only the best max_edges_per_node outgoing edges (by
+        LM-free score, plus the single-syllable edge). Because LM log
+        probabilities are <= 0 an edge is not LM-scored when its LM-free score already
+        cannot reach the beam at the target node.
+        Returns (words, lm_queries, bimm_flags), bimm_flags[k] telling whether words[k] is a Bi-MM edge.
+        """
+        ctx_len = max(0, self.max_order - 1) if self._use_lm else 0
+        beam = float('inf') if self.beam is None else self.beam
+
+        # states[i][context] = (score, prev_node, prev_context, word, is_bimm)
+        states = [dict() for _ in range(n + 1)]
+        states[0][()] = (0.0, None, None, None, False)
+        best = [-float('inf')] * (n + 1)
+        best[0] = 0.0
+        lm_queries = 0
+
+        for i in range(n):
+            if not states[i]:
+                continue
+            edges = [(j, word, self._get_dict_score(word) + (prefix[j] - prefix[i]) / (j - i)
+                      + (self.bimm_boost if is_bimm else 0.0), is_bimm)
+                     for j, word, is_bimm in dag[i]]
+            if self.max_edges_per_node and len(edges) > self.max_edges_per_node:
+                ranked = sorted(edges, key=lambda e: -e[2])
+                kept = ranked[:self.max_edges_per_node]
+                kept += [e for e in ranked[self.max_edges_per_node:] if e[0] == i + 1][:1]
+                edges = kept
+
+            hyps = sorted(states[i].items(), key=lambda kv: -kv[1][0])
+            if self.max_states_per_node:
+                del hyps[self.max_states_per_node:]
+            for context, (score, _, _, _, _) in hyps:
+                if score < best[i] - beam:
+                    break
+                for j, word, static, is_bimm in edges:
+                    if score + static < best[j] - beam:
+                        continue
+                    total = score + static
+                    if ctx_len:
+                        total += self._get_lm_score(list(context), word)
+                        lm_queries += 1
+                    new_context = (context + (word,))[-ctx_len:] if ctx_len else ()
+                    old = states[j].get(new_context)
+                    if old is None or old[0] < total:
+                        states[j][new_context] = (total, i, context, word, is_bimm)
+                        if total > best[j]:
+                            best[j] = total
+            states[i] = {c: v for c, v in hyps if v[0] >= best[i] - beam}
+
+        context = max(states[n], key=lambda c: states[n][c][0])
+        words = []
+        bimm_flags = []
+        node = n
+        while node > 0:
+            _, prev, prev_context, word, is_bimm = states[node][context]
+            words.append(word)
+            bimm_flags.append(is_bimm)
+            node, context = prev, prev_context
+        return words[::-1], lm_queries, bimm_flags[::-1]
+
+    def _viterbi(self, dag, n, prefix):
+        """Exact Viterbi decoding over the DAG; returns (words, lm_queries, bimm_flags)"""
+        scores = [-float('inf')] * (n + 1)
+        paths = [None] * (n + 1)
+        histories = [[] for _ in range(n + 1)]
+        scores[0] = 0
+        lm_queries = 0
+
+        for i in range(n):
+            edges = dag[i]
+            if self._use_lm:
+                lm_queries += len(edges)
+            for j, word, is_bimm in edges:
+                total = self._edge_score(histories[i], word, is_bimm, (prefix[j] - prefix[i]) / (j - i))
+                if scores[j] < scores[i] + total:
+                    scores[j] = scores[i] + total
+                    paths[j] = (i, word, is_bimm)
+                    histories[j] = histories[i] + [word]
+
+        result = []
+        bimm_flags = []
+        idx = n
+        while idx > 0:
+            prev, word, is_bimm = paths[idx]
+            result.append(word)
+            bimm_flags.append(is_bimm)
+            idx = prev
+        return result[::-1], lm_queries, bimm_flags[::-1]
+
+    def _viterbi_jit(self, kernel, dag, n, prefix):
+        """
+        _viterbi() for LM-free scoring: edge scores are computed once into flat arrays and
+        the relaxation runs in the compiled kernel. Returns (words, 0, bimm_flags).
+        """
+        import numpy as np
+        starts, ends, scores, words, bimm_flags = [], [], [], [], []
+        word_dict = self._word_dict
+        dict_weight = self.dict_weight
+        for i in range(n):
+            for j, word, is_bimm in dag[i]:
+                # same operation order as _edge_score(), so the float sums are identical
+                total = (dict_weight if word in word_dict else 0.0) + (prefix[j] - prefix[i]) / (j - i)
+                if is_bimm:
+                    total += self.bimm_boost
+                starts.append(i)
+                ends.append(j)
+                scores.append(total)
+                words.append(word)
+                bimm_flags.append(is_bimm)
+        back = kernel(n, np.array(starts, dtype=np.int64), np.array(ends, dtype=np.int64),
+                      np.array(scores, dtype=np.float64)).tolist()
+        result = []
+        path_flags = []
+        idx = n
+        while idx > 0:
+            e = back[idx]
+            result.append(words[e])
+            path_flags.append(bimm_flags[e])
+            idx = starts[e]
+        return result[::-1], 0, path_flags[::-1]
+
+    def _decode(self, dag, n, prefix):
+        if self.beam is not None or self.max_edges_per_node or self.max_states_per_node:
+            return self._beam_decode(dag, n, prefix)
+        if self.engine == 'numba' and not self._use_lm:
+            # LM scores depend on the best history at each node, so LM runs stay in Python
+            kernel = _numba_viterbi_kernel()
+            if kernel is not None:
+                return self._viterbi_jit(kernel, dag, n, prefix)
+        return self._viterbi(dag, n, prefix)
+
+    def segment(self, text, line_idx=0):
+        if self.metrics is not None or self.slow_lines is not None:
+            return self._segment_profiled(text, line_idx)
+        text = self._preprocess_text(text)
+        self._ensure_loaded()
+        syllables = self.syllable_break(text)
+        n = len(syllables)
+        dag = self._build_dag(syllables)
+        prefix = self._syl_prefix(syllables)
+        words, _, bimm_flags = self._decode(dag, n, prefix)
+        if self.visualize_dag:
+            self._visualize_dag(self._score_dag_edges(dag, n, prefix), syllables, line_idx)
+        result = self._finalize(words)
+        if self.word_stats is not None:
+            self.word_stats.add(self, words, bimm_flags, result)
+        return result
+
+    def _segment_profiled(self, text, line_idx=0):
+        """segment() with each stage timed; the LineProfile goes to metrics and slow_lines"""
+        self._ensure_loaded()   # first-use resource loading is not charged to the line
+        clock = time.perf_counter
+        t0 = clock()
+        raw = text
+        text = self._preprocess_text(text)
+        t1 = clock()
+        syllables = self.syllable_break(text)
+        n = len(syllables)
+        t2 = clock()
+        dag = self._build_dag(syllables)
+        prefix = self._syl_prefix(syllables)
+        t3 = clock()
+        words, lm_queries, bimm_flags = self._decode(dag, n, prefix)
+        t4 = clock()
+        if self.visualize_dag:
+            self._visualize_dag(self._score_dag_edges(dag, n, prefix), syllables, line_idx)
+        result = self._finalize(words)
+        t5 = clock()
+        if self.word_stats is not None:
+            self.word_stats.add(self, words, bimm_flags, result)
+
+        profile = LineProfile(line_idx, raw, syllables, sum(len(edges) for edges in dag.values()),
+                              lm_queries, any(bimm_flags), (t1 - t0, t2 - t1, t3 - t2, t4 - t3, t5 - t4))
+        if self.metrics is not None:
+            self.metrics.observe(self, profile)
+        if self.slow_lines is not None:
+            self.slow_lines.observe(profile)
+        return result
+
+    def segment_nbest(self, text, k=5):
+        """
+        Return up to k (score, segmentation) pairs, best first, using lazy k-best
+        Viterbi over the same DAG and scoring as segment() (Huang & Chiang, Algorithm 3).
+        Derivations are only expanded when a further rank is requested, so the cost
+        grows gently with k. Rank 1 is always the path segment() returns, so n-best
+        output agrees with plain output. Scores are exact path scores, but with an LM
+        the edge score depends on the path history, so the search is approximate: it
+        may miss paths and emit them out of order. The LM ranks after the first are
+        drawn from 2k derivations, sorted by score; they are not the true top k.
+        """
+        text = self._preprocess_text(text)
+        self._ensure_loaded()
+        syllables = self.syllable_break(text)
+        n = len(syllables)
+        dag = self._build_dag(syllables)
+        prefix = self._syl_prefix(syllables)
+
+        # Incoming edges per node; parallel Bi-MM/dictionary edges with the same word
+        # would only produce duplicate segmentations, so keep the higher-scoring one.
+        incoming = defaultdict(dict)
+        for i in range(n):
+            for j, word, is_bimm in dag[i]:
+                key = (i, word)
+                if key not in incoming[j] or (is_bimm and self.bimm_boost > 0):
+                    incoming[j][key] = is_bimm
+
+        # kbest[j][r] = (score, prev_node, prev_rank, word, history)
+        kbest = [[] for _ in range(n + 1)]
+        kbest[0].append((0.0, None, None, None, []))
+        cand = [[] for _ in range(n + 1)]
+        pending = [None] * (n + 1)   # successor of the last popped derivation, pushed lazily
+        counter = 0
+
+        def push(j, i, r, word, is_bimm):
+            nonlocal counter
+            score, _, _, _, history = kbest[i][r]
+            total = score + self._edge_score(history, word, is_bimm, (prefix[j] - prefix[i]) / (j - i))
+            heapq.heappush(cand[j], (-total, counter, i, r, word, is_bimm))
+            counter += 1
+
+        def pop(j):
+            neg, _, i, r, word, is_bimm = heapq.heappop(cand[j])
+            kbest[j].append((-neg, i, r, word, kbest[i][r][4] + [word]))
+            pending[j] = (i, r + 1, word, is_bimm)
+
+        # 1-best for every node in topological order
+        for j in range(1, n + 1):
+            for (i, word), is_bimm in incoming[j].items():
+                push(j, i, 0, word, is_bimm)
+            pop(j)
+
+        def ensure(node, rank):
+            """Make kbest[node][rank] available if such a derivation exists (iterative, no recursion)"""
+            stack = [(node, rank)]
+            while stack:
+                j, want = stack[-1]
+                if len(kbest[j]) > want:
+                    stack.pop()
+                    continue
+                if pending[j] is not None:
+                    i, r, word, is_bimm = pending[j]
+                    if len(kbest[i]) <= r and (cand[i] or pending[i] is not None):
+                        stack.append((i, r))
+                        continue
+                    if len(kbest[i]) > r:
+                        push(j, i, r, word, is_bimm)
+                    pending[j] = None
+                if not cand[j]:
+                    stack.pop()
+                    continue
+                pop(j)
+            return len(kbest[node]) > rank
+
+        results = []
+        seen = {}     # segmentation -> position in results
+        rank = 0
+        want = 2 * k if self._use_lm else k
+        while len(results) < want and ensure(n, rank):
+            words = []
+            j, r = n, rank
+            while j > 0:
+                _, i, prev_rank, word, _ = kbest[j][r]
+                words.append(word)
+                j, r = i, prev_rank
+            segmented = self._finalize(reversed(words))
+            score = kbest[n][rank][0]
+            if segmented not in seen:
+                seen[segmented] = len(results)
+                results.append((score, segmented))
+            elif score > results[seen[segmented]][0]:
+                results[seen[segmented]] = (score, segmented)
+            rank += 1
+
+        # rank 1 is the decoder's path, scored along its own edges
+        words, _, bimm_flags = self._decode(dag, n, prefix)
+        best = self._finalize(words)
+        total, history, i = 0.0, [], 0
+        for word, is_bimm in zip(words, bimm_flags):
+            j = next(j for j, w, b in dag[i] if w == word and b == is_bimm)
+            total += self._edge_score(history, word, is_bimm, (prefix[j] - prefix[i]) / (j - i))
+            history.append(word)
+            i = j
+        results = [r for r in results if r[1] != best]
+        if self._use_lm:
+            results.sort(key=lambda r: -r[0])
+        return [(total, best)] + results[:k - 1]
+
+    def lattice(self, text, line_idx=0):
+        """Compact lattice of a line: syllables plus [start, end, word, score, is_bimm] edges"""
+        text = self._preprocess_text(text)
+        self._ensure_loaded()
+        syllables = self.syllable_break(text)
+        n = len(syllables)
+        scored = self._score_dag_edges(self._build_dag(syllables), n, self._syl_prefix(syllables))
+        edges = [[i, j, word, round(score, 4), int(is_bimm)]
+                 for i in range(n) for j, word, score, is_bimm in scored[i]]
+        return {'line': line_idx, 'syllables': syllables, 'edges': edges}
+
+    def path_score(self, text, segmented):
+        """
+        Model score of a segmentation of text (space-separated words, e.g. another
+        engine's output) under this segmenter's DAG and scoring, with full LM history.
+        Returns None if the words are not a path through the DAG (e.g. a post-rule
+        rewrote them).
+        """
+        text = self._preprocess_text(text)
+        self._ensure_loaded()
+        syllables = self.syllable_break(text)
+        n = len(syllables)
+        dag = self._build_dag(syllables)
+        prefix = self._syl_prefix(syllables)
+        tokens = segmented.split()
+        i = pos = 0
+        history = []
+        total = 0.0
+        while i < n:
+            # edges spelling the next token(s) (a word may hold a space when spaces are kept);
+            # a Bi-MM edge and a plain edge may both match
+            matches = {}
+            for j, word, is_bimm in dag[i]:
+                pieces = word.split()
+                t = pos + len(pieces)
+                if tokens[pos:t] != pieces:
+                    continue
+                score = self._edge_score(history, word, is_bimm, (prefix[j] - prefix[i]) / (j - i))
+                if (t, j) not in matches or score > matches[(t, j)][0]:
+                    matches[(t, j)] = (score, word)
+            if not matches:
+                return None
+            (pos, i), (score, word) = max(matches.items())
+            total += score
+            history.append(word)
+        return total if pos == len(tokens) else None
+
+class AsyncSegmenter:
+    """
+    asyncio front-end for HybridDAGSegmenter.
+
+    Requests from segment_async() are queued and coalesced into micro-batches (up to
+    batch_size lines, waiting at most batch_delay seconds for more), which run on an
+    internal thread pool with at most max_concurrency batches in flight, so the event
+    loop is never blocked by a long line. A request that is cancelled or times out
+    before its batch starts is dropped from the batch.
+
+    Usage:
+        aseg = AsyncSegmenter(segmenter, max_concurrency=4)
+        text = await aseg.segment_async(line, timeout=1.0)
+        async for text in aseg.segment_stream(lines):
+            ...
+        await aseg.close()
+    """
+
+    def __init__(self, segmenter, max_concurrency=4, batch_size=32, batch_delay=0.002, executor=None):
+        self.segmenter = segmenter
+        self.max_concurrency = max_concurrency
+        self.batch_size = batch_size
+        self.batch_delay = batch_delay
+        self._own_executor = executor is None
+        self._executor = executor
+        self._queue = None
+        self._dispatcher = None
+        self._slots = None
+        self._running = set()
+
+    def _ensure_started(self):
+        if self._dispatcher is None or self._dispatcher.done():
+            import asyncio
+            from concurrent.futures import ThreadPoolExecutor
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency)
+            self._queue = asyncio.Queue()
+            self._slots = asyncio.Semaphore(self.max_concurrency)
+            self._dispatcher = asyncio.get_running_loop().create_task(self._dispatch())
+
+    async def segment_async(self, text, timeout=None):
+        """Segment one line without blocking the event loop; raises asyncio.TimeoutError after timeout seconds"""
+        import asyncio
+        self._ensure_started()
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((text, future))
+        if timeout is None:
+            return await future
+        return await asyncio.wait_for(future, timeout)
+
+    async def segment_stream(self, lines, timeout=None, window=None):
+        """Segment a (sync or async) iterable of lines, yielding results in input order.
+        At most `window` lines are in flight (default: batch_size * max_concurrency)."""
+        import asyncio
+        from collections import deque
+        window = window or self.batch_size * self.max_concurrency
+        pending = deque()
+        try:
+            if hasattr(lines, '__aiter__'):
+                async for line in lines:
+                    pending.append(asyncio.ensure_future(self.segment_async(line, timeout)))
+                    if len(pending) >= window:
+                        yield await pending.popleft()
+            else:
+                for line in lines:
+                    pending.append(asyncio.ensure_future(self.segment_async(line, timeout)))
+                    if len(pending) >= window:
+                        yield await pending.popleft()
+            while pending:
+                yield await pending.popleft()
+        finally:
+            for future in pending:
+                future.cancel()
+
+    async def _dispatch(self):
+        import asyncio
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            if self.batch_delay and self._queue.qsize() < self.batch_size - 1:
+                await asyncio.sleep(self.batch_delay)
+            while len(batch) < self.batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            batch = [(text, future) for text, future in batch if not future.done()]
+            if not batch:
+                continue
+            await self._slots.acquire()
+            task = loop.create_task(self._run_batch(loop, batch))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    async def _run_batch(self, loop, batch):
+        try:
+            results = await loop.run_in_executor(self._executor, self.segmenter.segment_batch,
+                                                 [text for text, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+        else:
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+        finally:
+            self._slots.release()
+
+    async def close(self):
+        """Stop the dispatcher, wait for running batches and shut down the internal executor"""
+        import asyncio
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+            try:
+                await self._dispatcher
+            except asyncio.CancelledError:
+                pass
+        if self._running:
+            await asyncio.gather(*self._running, return_exceptions=True)
+        if self._own_executor and self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+
+# === Request Batching ===
+LATENCY_BUCKETS_MS = [0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500]
+BATCH_SIZE_BUCKETS = [1, 2, 4, 8, 16, 32, 64, 128, 256, 512]
+
+
+class Histogram:
+    """Fixed-bucket histogram: counts[i] holds values <= bounds[i]; the last slot holds the rest"""
+
+    def __init__(self, bounds):
+        self.bounds = list(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        idx = bisect.bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[idx] += 1
+            self.count += 1
+            self.sum += value
+
+    def merge(self, other):
+        with self._lock:
+            for idx, count in enumerate(other.counts):
+                self.counts[idx] += count
+            self.count += other.count
+            self.sum += other.sum
+
+    def percentile(self, q):
+        """Upper bucket bound containing the q-th quantile (0 < q <= 1); inf if it is in the overflow slot"""
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        for idx, count in enumerate(self.counts):
+            seen += count
+            if seen >= target:
+                return self.bounds[idx] if idx < len(self.bounds) else float('inf')
+        return float('inf')
+
+    def format(self, title):
+        lines = [f"{title}: count={self.count} mean={self.sum / max(self.count, 1):.3f} "
+                 f"p50<={self.percentile(0.5)} p99<={self.percentile(0.99)}"]
+        labels = [f"<= {b}" for b in self.bounds] + [f"> {self.bounds[-1]}"]
+        for label, count in zip(labels, self.counts):
+            if count:
+                lines.append(f"  {label:>10}: {count}")
+        return '\n'.join(lines)
+
+
+class _BatchRequest:
+    __slots__ = ('text', 'done', 'result', 'error', 'start')
+
+    def __init__(self, text):
+        self.text = text
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.start = time.perf_counter()
+
+
+class BatchingSegmenter:
+    """
+    Coalesces single-line segment() calls from many threads into batches.
+
+    A background thread collects requests for up to max_delay_ms or max_batch lines,
+    segments each distinct sentence of the batch once via segment_batch(), and hands
+    the results back to the waiting callers. The window is adaptive: it tracks how many
+    callers are usually waiting at once and flushes as soon as that many requests are
+    queued, so a lone caller does not pay the full delay.
+    latency_ms and batch_sizes are histograms for tuning the window.
+    """
+
+    def __init__(self, segmenter, max_delay_ms=2.0, max_batch=64):
+        self.segmenter = segmenter
+        self.max_delay = max_delay_ms / 1000.0
+        self.max_batch = max_batch
+        self.latency_ms = Histogram(LATENCY_BUCKETS_MS)
+        self.batch_sizes = Histogram(BATCH_SIZE_BUCKETS)
+        self.requests = 0
+        self.deduplicated = 0
+        self._pending = []
+        self._cond = threading.Condition()
+        self._closed = False
+        self._in_flight = 0
+        self._mean_callers = 1.0     # EWMA of requests in flight when a new one arrives
+        self._thread = threading.Thread(target=self._worker, name='oppa-batcher', daemon=True)
+        self._thread.start()
+
+    def segment(self, text, timeout=None):
+        request = _BatchRequest(text)
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("BatchingSegmenter is closed")
+            self._in_flight += 1
+            self._mean_callers = 0.9 * self._mean_callers + 0.1 * self._in_flight
+            self._pending.append(request)
+            self._cond.notify()
+        if not request.done.wait(timeout):
+            raise TimeoutError(f"segmentation did not finish within {timeout}s")
+        if request.error is not None:
+            raise request.error
+        return request.result
+
+    def _next_batch(self):
+        with self._cond:
+            while not self._pending and not self._closed:
+                self._cond.wait()
+            if not self._pending:
+                return None
+            deadline = self._pending[0].start + self.max_delay
+            while len(self._pending) < self.max_batch and not self._closed:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0 or len(self._pending) >= round(self._mean_callers):
+                    break
+                self._cond.wait(remaining)
+            batch = self._pending[:self.max_batch]
+            del self._pending[:self.max_batch]
+            return batch
+
+    def _worker(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            unique = list(dict.fromkeys(request.text for request in batch))
+            try:
+                results = dict(zip(unique, self.segmenter.segment_batch(unique)))
+            except Exception:
+                results = {}
+                for text in unique:
+                    try:
+                        results[text] = self.segmenter.segment(text)
+                    except Exception as e:
+                        results[text] = e
+            with self._cond:
+                self._in_flight -= len(batch)
+            now = time.perf_counter()
+            for request in batch:
+                result = results[request.text]
+                if isinstance(result, Exception):
+                    request.error = result
+                else:
+                    request.result = result
+                self.latency_ms.observe((now - request.start) * 1000.0)
+                request.done.set()
+            self.batch_sizes.observe(len(batch))
+            self.requests += len(batch)
+            self.deduplicated += len(batch) - len(unique)
+
+    def stats(self):
+        return {
+            'requests': self.requests,
+            'deduplicated': self.deduplicated,
+            'batches': self.batch_sizes.count,
+            'mean_batch_size': self.batch_sizes.sum / max(self.batch_sizes.count, 1),
+            'latency_p50_ms': self.latency_ms.percentile(0.5),
+            'latency_p99_ms': self.latency_ms.percentile(0.99),
+        }
+
+    def format_stats(self):
+        return '\n'.join([self.latency_ms.format('latency (ms)'), self.batch_sizes.format('batch size'),
+                          f"requests={self.requests} deduplicated={self.deduplicated}"])
+
+    def close(self):
+        """Finish queued requests and stop the background thread"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join()
+
+
+class WordOverlay:
+    """
+    Dictionary view for HybridDAGSegmenter.tenant(): the owner's dictionary plus per-tenant
+    added/removed words. Both sets live in one (added, removed) tuple of frozensets that
+    updates replace in a single assignment, so a reader never sees half an update.
+    """
+    __slots__ = ('owner', 'words')
+
+    def __init__(self, owner, added=(), removed=()):
+        self.owner = owner
+        added = frozenset(added)
+        self.words = (added, frozenset(removed) - added)
+
+    @property
+    def added(self):
+        return self.words[0]
+
+    @property
+    def removed(self):
+        return self.words[1]
+
+    def __contains__(self, word):
+        added, removed = self.words
+        return word in added or (word not in removed and word in self.owner._word_dict)
+
+    def __iter__(self):
+        added, removed = self.words
+        yield from added
+        for word in self.owner._word_dict:
+            if word not in removed and word not in added:
+                yield word
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+
+# === Metrics ===
+STAGE_BUCKETS_S = [0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0]
+SIZE_BUCKETS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000]
+SEGMENT_STAGES = ('preprocess', 'syllable_break', 'dag', 'decode', 'postprocess')
+
+# Per-line record of a profiled segment(); stage_seconds follows SEGMENT_STAGES
+LineProfile = namedtuple('LineProfile', 'line_idx text syllables dag_edges lm_queries used_bimm stage_seconds')
+
+
+class SegmenterMetrics:
+    """
+    Production metrics for HybridDAGSegmenter, rendered in the Prometheus text format.
+
+    Attach with `segmenter.metrics = SegmenterMetrics()`; segment() then times its stages
+    and passes each line to observe(), which records lines and syllables processed,
+    per-stage latency, DAG nodes/edges and LM queries per line, lines whose best path
+    uses a Bi-MM edge and OOV syllables (not in the syllable frequency table, or not in the dictionary when no
+    table is loaded). Caches such as HybridDAGSegmenter.lm_cache report their hit
+    counts through add_cache().
+    """
+
+    def __init__(self):
+        self.lines = 0
+        self.syllables = 0
+        self.oov_syllables = 0
+        self.bimm_lines = 0
+        self.stage_seconds = {stage: Histogram(STAGE_BUCKETS_S) for stage in SEGMENT_STAGES}
+        self.dag_nodes = Histogram(SIZE_BUCKETS)
+        self.dag_edges = Histogram(SIZE_BUCKETS)
+        self.lm_queries = Histogram(SIZE_BUCKETS)
+        self.caches = {}
+        self._lock = threading.Lock()
+
+    def add_cache(self, name, stats):
+        """Export a cache; stats() returns (hits, misses)"""
+        self.caches[name] = stats
+
+    def observe(self, seg, profile):
+        """Record one segmented line (a LineProfile from seg)"""
+        known = seg._syl_freq or seg._word_dict
+        oov = sum(1 for syl in profile.syllables if syl not in known)
+        for stage, seconds in zip(SEGMENT_STAGES, profile.stage_seconds):
+            self.stage_seconds[stage].observe(seconds)
+        self.dag_nodes.observe(len(profile.syllables))
+        self.dag_edges.observe(profile.dag_edges)
+        self.lm_queries.observe(profile.lm_queries)
+        with self._lock:
+            self.lines += 1
+            self.syllables += len(profile.syllables)
+            self.oov_syllables += oov
+            self.bimm_lines += profile.used_bimm
+
+    @staticmethod
+    def _histogram_lines(name, hist, labels=''):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(hist.bounds + ['+Inf'], hist.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{labels}{"," if labels else ""}le="{bound}"}} {cumulative}')
+        suffix = f'{{{labels}}}' if labels else ''
+        lines.append(f'{name}_sum{suffix} {hist.sum}')
+        lines.append(f'{name}_count{suffix} {hist.count}')
+        return lines
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format"""
+        out = []
+
+        def metric(name, kind, help_text, samples):
+            out.append(f'# HELP {name} {help_text}')
+            out.append(f'# TYPE {name} {kind}')
+            out.extend(samples)
+
+        with self._lock:
+            lines, syllables, oov, bimm = self.lines, self.syllables, self.oov_syllables, self.bimm_lines
+        metric('oppa_lines_total', 'counter', 'Lines segmented', [f'oppa_lines_total {lines}'])
+        metric('oppa_syllables_total', 'counter', 'Syllables segmented', [f'oppa_syllables_total {syllables}'])
+        metric('oppa_oov_syllables_total', 'counter', 'Syllables missing from the frequency table or dictionary',
+               [f'oppa_oov_syllables_total {oov}'])
+        metric('oppa_bimm_lines_total', 'counter', 'Lines whose best path uses a Bi-MM edge',
+               [f'oppa_bimm_lines_total {bimm}'])
+        metric('oppa_oov_syllable_ratio', 'gauge', 'OOV syllables / syllables',
+               [f'oppa_oov_syllable_ratio {oov / syllables if syllables else 0.0}'])
+        metric('oppa_bimm_line_ratio', 'gauge', 'Bi-MM decided lines / lines',
+               [f'oppa_bimm_line_ratio {bimm / lines if lines else 0.0}'])
+        samples = []
+        for stage, hist in self.stage_seconds.items():
+            samples += self._histogram_lines('oppa_stage_seconds', hist, f'stage="{stage}"')
+        metric('oppa_stage_seconds', 'histogram', 'Per-line latency of each segmentation stage', samples)
+        metric('oppa_dag_nodes', 'histogram', 'DAG nodes (syllables) per line',
+               self._histogram_lines('oppa_dag_nodes', self.dag_nodes))
+        metric('oppa_dag_edges', 'histogram', 'DAG edges per line',
+               self._histogram_lines('oppa_dag_edges', self.dag_edges))
+        metric('oppa_lm_queries', 'histogram', 'LM queries per line',
+               self._histogram_lines('oppa_lm_queries', self.lm_queries))
+        if self.caches:
+            hits, misses, ratios = [], [], []
+            for name, stats in self.caches.items():
+                h, m = stats()
+                hits.append(f'oppa_cache_hits_total{{cache="{name}"}} {h}')
+                misses.append(f'oppa_cache_misses_total{{cache="{name}"}} {m}')
+                ratios.append(f'oppa_cache_hit_ratio{{cache="{name}"}} {h / (h + m) if h + m else 0.0}')
+            metric('oppa_cache_hits_total', 'counter', 'Cache hits', hits)
+            metric('oppa_cache_misses_total', 'counter', 'Cache misses', misses)
+            metric('oppa_cache_hit_ratio', 'gauge', 'Cache hits / lookups', ratios)
+        return '\n'.join(out) + '\n'
+
+    def write(self, path):
+        atomic_write(path, self.render().encode('utf-8'))
+
+
+class MetricsExporter:
+    """
+    Publishes SegmenterMetrics in the background: rewrites a file every `interval`
+    seconds (for node_exporter's textfile collector) and/or serves GET /metrics on a port.
+    """
+
+    def __init__(self, metrics, path=None, interval=15.0, port=None, host=''):
+        self.metrics = metrics
+        self.path = path
+        self.interval = interval
+        self.port = port
+        self.host = host
+        self._stop = threading.Event()
+        self._thread = None
+        self._server = None
+
+    def start(self):
+        if self.path:
+            self._thread = threading.Thread(target=self._run, name='oppa-metrics', daemon=True)
+            self._thread.start()
+        if self.port is not None:
+            from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+            metrics = self.metrics
+
+            class Handler(BaseHTTPRequestHandler):
+                def do_GET(self):
+                    if self.path.split('?')[0] not in ('/', '/metrics'):
+                        self.send_error(404)
+                        return
+                    body = metrics.render().encode('utf-8')
+                    self.send_response(200)
+                    self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                    self.send_header('Content-Length', str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+
+                def log_message(self, *args):
+                    pass
+
+            self._server = ThreadingHTTPServer((self.host, self.port), Handler)
+            self.port = self._server.server_address[1]
+            threading.Thread(target=self._server.serve_forever, name='oppa-metrics-http', daemon=True).start()
+        return self
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.metrics.write(self.path)
+
+    def stop(self):
+        """Stop publishing; the file gets a final write with the complete run"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        if self.path:
+            self.metrics.write(self.path)
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+
+
+# === Slow-Line Diagnostics ===
+class SlowLineCapture:
+    """
+    Keeps the n slowest lines of a run, to find the inputs behind tail latency (very long
+    lines, long non-Myanmar runs, repeated characters that blow up the DAG).
+
+    Attach with `segmenter.slow_lines = SlowLineCapture(20)`; segment() then times its
+    stages and each line's LineProfile competes for a place by total time. report()
+    lists the kept lines slowest first with their syllable count, DAG edges, LM queries
+    and per-stage timings; render_dags() draws the DAG of just those lines with the
+    segmenter's _visualize_dag().
+    """
+
+    def __init__(self, n=20):
+        self.n = n
+        self.lines = 0
+        self._heap = []   # (total seconds, sequence, LineProfile), fastest kept line first
+        self._lock = threading.Lock()
+
+    def observe(self, profile):
+        total = sum(profile.stage_seconds)
+        with self._lock:
+            self.lines += 1
+            if len(self._heap) < self.n:
+                heapq.heappush(self._heap, (total, self.lines, profile))
+            elif total > self._heap[0][0]:
+                heapq.heapreplace(self._heap, (total, self.lines, profile))
+
+    def profiles(self):
+        """Kept LineProfiles, slowest first"""
+        with self._lock:
+            return [profile for _, _, profile in sorted(self._heap, key=lambda item: -item[0])]
+
+    def report(self):
+        """One dict per kept line, slowest first; times in milliseconds"""
+        rows = []
+        for rank, profile in enumerate(self.profiles(), 1):
+            rows.append({'rank': rank, 'line': profile.line_idx,
+                         'total_ms': round(sum(profile.stage_seconds) * 1000, 3),
+                         'stage_ms': {stage: round(seconds * 1000, 3)
+                                      for stage, seconds in zip(SEGMENT_STAGES, profile.stage_seconds)},
+                         'chars': len(profile.text), 'syllables': len(profile.syllables),
+                         'dag_edges': profile.dag_edges, 'lm_queries': profile.lm_queries,
+                         'text': profile.text})
+        return rows
+
+    def write(self, path):
+        """Write report() as JSON lines"""
+        import json
+        with open_text(path, 'w') as f:
+            for row in self.report():
+                f.write(json.dumps(row, ensure_ascii=False) + '\n')
+
+    def format_report(self, preview=40):
+        rows = self.report()
+        lines = [f"[slow-lines] {len(rows)} slowest of {self.lines} lines",
+                 f"  {'rank':>4} {'line':>8} {'ms':>9} {'syl':>6} {'edges':>7} {'lm_q':>7}  slowest stage  text"]
+        for row in rows:
+            stage = max(row['stage_ms'], key=row['stage_ms'].get)
+            text = row['text'] if len(row['text']) <= preview else row['text'][:preview] + '...'
+            lines.append(f"  {row['rank']:4d} {row['line']:8d} {row['total_ms']:9.3f} {row['syllables']:6d} "
+                         f"{row['dag_edges']:7d} {row['lm_queries']:7d}  {stage:<14} {text}")
+        return '\n'.join(lines)
+
+    def render_dags(self, segmenter, output_dir=None):
+        """Draw the DAG of each kept line (.dot, plus .pdf when Graphviz is installed)"""
+        if output_dir is not None:
+            import copy
+            segmenter = copy.copy(segmenter)
+            segmenter.dag_output_dir = output_dir
+        os.makedirs(segmenter.dag_output_dir, exist_ok=True)
+        segmenter._ensure_loaded()
+        missing_dot = False
+        for profile in self.profiles():
+            syllables = segmenter.syllable_break(segmenter._preprocess_text(profile.text))
+            n = len(syllables)
+            dag = segmenter._build_dag(syllables)
+            edges = segmenter._score_dag_edges(dag, n, segmenter._syl_prefix(syllables))
+            try:
+                segmenter._visualize_dag(edges, syllables, profile.line_idx)
+            except FileNotFoundError:
+                missing_dot = True
+        if missing_dot:
+            print(f"Warning: Graphviz 'dot' not found; wrote only .dot files to {segmenter.dag_output_dir}",
+                  file=sys.stderr)
+
+
+# === Word Frequency Statistics ===
+WORD_KINDS = ('dict', 'nondict', 'bimm')
+
+
+class WordStats:
+    """
+    Word counts collected while segmenting, for lexicon maintenance and OOV discovery.
+
+    Attach with `segmenter.word_stats = WordStats()`; each segment() then counts its
+    output tokens as dictionary ('dict') or non-dictionary ('nondict') words, checked
+    against word_dict at that moment, and separately the decoded words (before
+    post-rules) that the best path took from a Bi-MM edge ('bimm'). Stats of separate
+    workers or runs are combined with merge(), and read() loads a written TSV back.
+    """
+
+    def __init__(self):
+        self.counts = {kind: Counter() for kind in WORD_KINDS}
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        return self.counts
+
+    def __setstate__(self, counts):
+        self.counts = counts
+        self._lock = threading.Lock()
+
+    def add(self, seg, words, bimm_flags, output):
+        """Count one line: its decoded words with their Bi-MM flags and its final (post-edited) output"""
+        word_dict = seg._word_dict
+        known, unknown = Counter(), Counter()
+        for token in output.split():
+            if token in word_dict:
+                known[token] += 1
+            else:
+                unknown[token] += 1
+        bimm = Counter(word for word, is_bimm in zip(words, bimm_flags) if is_bimm) if any(bimm_flags) else None
+        with self._lock:
+            self.counts['dict'].update(known)
+            self.counts['nondict'].update(unknown)
+            if bimm:
+                self.counts['bimm'].update(bimm)
+
+    def merge(self, other):
+        with self._lock:
+            for kind in WORD_KINDS:
+                self.counts[kind].update(other.counts[kind])
+        return self
+
+    def rows(self):
+        """(word, count, kind) rows, most frequent first"""
+        with self._lock:
+            rows = [(word, count, kind) for kind in WORD_KINDS for word, count in self.counts[kind].items()]
+        rows.sort(key=lambda row: (-row[1], row[2], row[0]))
+        return rows
+
+    def write(self, path):
+        """Write a 'word<TAB>count<TAB>kind' TSV with a header line (.gz/.bz2/.xz/.zst are compressed)"""
+        with open_text(path, 'w') as f:
+            f.write('word\tcount\tkind\n')
+            for word, count, kind in self.rows():
+                f.write(f"{word}\t{count}\t{kind}\n")
+
+    @classmethod
+    def read(cls, path):
+        stats = cls()
+        with open_text(path) as f:
+            for line in f:
+                parts = line.rstrip('\n').split('\t')
+                if len(parts) == 3 and parts[2] in stats.counts and parts[1].isdigit():
+                    stats.counts[parts[2]][parts[0]] += int(parts[1])
+        return stats
+
+    def format_summary(self):
+        with self._lock:
+            tokens = {kind: sum(c.values()) for kind, c in self.counts.items()}
+            types = {kind: len(c) for kind, c in self.counts.items()}
+        total = tokens['dict'] + tokens['nondict']
+        return (f"[word-stats] {total} tokens: {tokens['dict']} dictionary ({types['dict']} types), "
+                f"{tokens['nondict']} non-dictionary ({types['nondict']} types, "
+                f"{tokens['nondict'] / total if total else 0.0:.2%}), "
+                f"{tokens['bimm']} from Bi-MM edges ({types['bimm']} types)")
+
+
+# === Fused Text Pipeline ===
+PIPELINE_STAGES = ('space', 'segment', 'postrules', 'punc', 'call')
+
+
+class TextPipeline:
+    """
+    Runs a chain of text stages on each line in a single streaming pass, instead of
+    one process per tool (smart_space_remover.py | oppa_word.py | correct_my_punc.py)
+    that each re-read and rewrite the corpus.
+
+    Stages run in the order they are added; each maps a string to a string. segment()
+    has the HybridDAGSegmenter.segment() signature, so a pipeline can stand in for the
+    segmenter wherever lines are segmented (text, JSONL/Parquet, jobs, thread pools).
+    With timing=True each stage's per-line latency is kept in a Histogram.
+    """
+
+    def __init__(self, segmenter=None, timing=False):
+        self.segmenter = segmenter
+        self.stages = []
+        self.timing = {} if timing else None
+        self.lines = 0
+
+    def add(self, name, func, takes_line_idx=False):
+        """Append a stage; with takes_line_idx it is called as func(text, line_idx)"""
+        if any(stage_name == name for stage_name, _, _ in self.stages):
+            raise ValueError(f"duplicate pipeline stage name: {name}")
+        self.stages.append((name, func, takes_line_idx))
+        if self.timing is not None:
+            self.timing[name] = Histogram(STAGE_BUCKETS_S)
+        return self
+
+    def add_space_removal(self, mode, name='space'):
+        if mode not in SPACE_REMOVE_MODES:
+            raise ValueError(f"unknown space removal mode: {mode}")
+        return self.add(name, lambda text: remove_spaces(text, mode))
+
+    def add_segmentation(self, name='segment'):
+        if self.segmenter is None:
+            raise ValueError("the segment stage needs a segmenter")
+        return self.add(name, self.segmenter.segment, takes_line_idx=True)
+
+    def add_post_rules(self, rule_file, name='postrules'):
+        rules = load_post_rules(rule_file)   # loaded now, so a bad path fails before the first line
+        if not rules:
+            print(f"Warning: no post-editing rules in {rule_file}", file=sys.stderr)
+        return self.add(name, lambda text: apply_post_rules(text, rules))
+
+    def add_punctuation_spacing(self, name='punc'):
+        return self.add(name, correct_segmentation)
+
+    @classmethod
+    def from_spec(cls, spec, segmenter=None, timing=False):
+        """
+        Build a pipeline from comma-separated stages: space:MODE, segment, postrules:FILE,
+        punc, call:MODULE:FUNCTION (a str -> str function), e.g. 'space:my_not_num,segment,punc'.
+        """
+        pipeline = cls(segmenter, timing)
+        for item in spec.split(','):
+            kind, _, arg = item.strip().partition(':')
+            if kind not in PIPELINE_STAGES:
+                raise ValueError(f"unknown pipeline stage '{kind}' (choose from {', '.join(PIPELINE_STAGES)})")
+            if kind in ('space', 'postrules', 'call') and not arg:
+                raise ValueError(f"pipeline stage '{kind}' needs an argument, e.g. {kind}:...")
+            if kind == 'space':
+                pipeline.add_space_removal(arg)
+            elif kind == 'segment':
+                pipeline.add_segmentation()
+            elif kind == 'postrules':
+                pipeline.add_post_rules(arg)
+            elif kind == 'punc':
+                pipeline.add_punctuation_spacing()
+            else:
+                import importlib
+                module_name, _, func_name = arg.rpartition(':')
+                if not module_name:
+                    raise ValueError(f"call stage needs MODULE:FUNCTION, got '{arg}'")
+                pipeline.add(arg, getattr(importlib.import_module(module_name), func_name))
+        return pipeline
+
+    def __getattr__(self, name):
+        # preload(), lattice(), reload() and friends go to the wrapped segmenter
+        if self.segmenter is None:
+            raise AttributeError(name)
+        return getattr(self.segmenter, name)
+
+    def segment(self, text, line_idx=0):
+        self.lines += 1
+        if self.timing is None:
+            for _, func, takes_line_idx in self.stages:
+                text = func(text, line_idx) if takes_line_idx else func(text)
+            return text
+        clock = time.perf_counter
+        for name, func, takes_line_idx in self.stages:
+            start = clock()
+            text = func(text, line_idx) if takes_line_idx else func(text)
+            self.timing[name].observe(clock() - start)
+        return text
+
+    def segment_batch(self, lines, threads=1, start_idx=0, executor=None):
+        if executor is None and threads <= 1:
+            return [self.segment(line, start_idx + i) for i, line in enumerate(lines)]
+        if self.segmenter is not None:
+            self.segmenter.preload()
+        if executor is not None:
+            return list(executor.map(self.segment, lines, range(start_idx, start_idx + len(lines))))
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            return list(pool.map(self.segment, lines, range(start_idx, start_idx + len(lines))))
+
+    def format_timing(self):
+        """Per-stage total time, share of the pipeline, mean and p99 per line"""
+        if self.timing is None:
+            return "[pipeline] timing disabled"
+        total = sum(hist.sum for hist in self.timing.values()) or 1e-12
+        lines = [f"[pipeline] {self.lines} lines, {total:.3f}s in stages"]
+        for name, hist in self.timing.items():
+            mean_ms = hist.sum / max(hist.count, 1) * 1000
+            lines.append(f"  {name:>12}: {hist.sum:8.3f}s {hist.sum / total:6.1%}  "
+                         f"mean {mean_ms:.3f} ms  p99 <= {hist.percentile(0.99) * 1000:g} ms")
+        return '\n'.join(lines)
+
+
+# === Shadow Mode ===
+class ShadowSegmenter:
+    """
+    Runs a candidate engine next to the reference HybridDAGSegmenter to validate an
+    optimization (pruning, caching, a different kernel) before it is trusted.
+
+    segment() always returns the reference result. A `sample_rate` fraction of lines
+    is also segmented by the candidate; both runs are timed, and each line where the
+    outputs differ is written to `diffs` as a JSON line with both segmentations and
+    their path scores under the reference model. report() gives the divergence rate
+    and the reference/candidate speedup. Other attributes come from the reference,
+    so a ShadowSegmenter can stand in for it.
+    """
+
+    def __init__(self, reference, candidate, sample_rate=1.0, diffs=None, seed=None):
+        import random
+        self.reference = reference
+        self.candidate = candidate
+        self.sample_rate = sample_rate
+        self.diffs = diffs
+        self.lines = 0
+        self.sampled = 0
+        self.diverged = 0
+        self.reference_seconds = 0.0
+        self.candidate_seconds = 0.0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name):
+        return getattr(self.reference, name)
+
+    def preload(self):
+        self.candidate.preload()
+        return self.reference.preload()
+
+    def reload(self, force=False):
+        self.candidate.reload(force)
+        return self.reference.reload(force)
+
+    def segment(self, text, line_idx=0):
+        clock = time.perf_counter
+        with self._lock:
+            self.lines += 1
+            sampled = self._random.random() < self.sample_rate
+        start = clock()
+        result = self.reference.segment(text, line_idx)
+        if not sampled:
+            return result
+        middle = clock()
+        other = self.candidate.segment(text, line_idx)
+        end = clock()
+        record = None
+        if other != result:
+            record = {'line': line_idx, 'input': text, 'reference': result, 'candidate': other,
+                      'reference_score': self.reference.path_score(text, result),
+                      'candidate_score': self.reference.path_score(text, other)}
+        with self._lock:
+            self.sampled += 1
+            self.reference_seconds += middle - start
+            self.candidate_seconds += end - middle
+            if record is not None:
+                self.diverged += 1
+                if self.diffs is not None:
+                    import json
+                    self.diffs.write(json.dumps(record, ensure_ascii=False) + '\n')
+        return result
+
+    def segment_batch(self, lines, threads=1, start_idx=0, executor=None):
+        return HybridDAGSegmenter.segment_batch(self, lines, threads, start_idx, executor)
+
+    def report(self):
+        with self._lock:
+            speedup = self.reference_seconds / self.candidate_seconds if self.candidate_seconds else 0.0
+            return {'lines': self.lines, 'sampled': self.sampled, 'diverged': self.diverged,
+                    'divergence_rate': self.diverged / self.sampled if self.sampled else 0.0,
+                    'reference_seconds': self.reference_seconds,
+                    'candidate_seconds': self.candidate_seconds, 'speedup': speedup}
+
+    def format_report(self):
+        r = self.report()
+        return (f"[shadow] lines {r['lines']}, sampled {r['sampled']}, diverged {r['diverged']} "
+                f"({r['divergence_rate']:.2%}); reference {r['reference_seconds']:.3f} s, "
+                f"candidate {r['candidate_seconds']:.3f} s, speedup {r['speedup']:.2f}x")
+
+
+# === Hot Reload Watcher ===
+def _file_fingerprint(path, prefix_len=None):
+    """Size, mtime, sha1 and whether the file ends with a newline; with prefix_len also the sha1 of that prefix"""
+    import hashlib
+    st = os.stat(path)
+    digest = hashlib.sha1()
+    prefix = hashlib.sha1() if prefix_len is not None else None
+    seen = 0
+    last = b''
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+            if prefix is not None and seen < prefix_len:
+                prefix.update(block[:prefix_len - seen])
+            seen += len(block)
+            last = block[-1:]
+    return {'size': st.st_size, 'mtime_ns': st.st_mtime_ns, 'sha1': digest.hexdigest(),
+            'prefix_sha1': prefix.hexdigest() if prefix is not None else None, 'newline_end': last == b'\n'}
+
+
+class ResourceWatcher:
+    """
+    Hot-reloads a segmenter's dictionary, syllable frequency and post-rule files.
+
+    A daemon thread polls the files every `interval` seconds (or wakes up on SIGHUP after
+    install_signal_handler()) and calls segmenter.reload(), so new structures are built
+    in the background while requests keep using the old ones until the swap.
+    """
+
+    def __init__(self, segmenter, interval=5.0, log=sys.stderr):
+        self.segmenter = segmenter
+        self.interval = interval
+        self.log = log
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self.segmenter.preload()
+        self.segmenter._fingerprint_files()
+        self._thread = threading.Thread(target=self._run, name='oppa-reload', daemon=True)
+        self._thread.start()
+        return self
+
+    def install_signal_handler(self, signum=None):
+        """Reload on a signal (default SIGHUP); must be called from the main thread"""
+        import signal
+        signal.signal(signum or signal.SIGHUP, lambda *_: self._wake.set())
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            if self._stop.is_set():
+                return
+            try:
+                reloaded = self.segmenter.reload()
+            except (OSError, ValueError, re.error) as e:
+                print(f"[reload] failed, keeping the current resources: {e}", file=self.log)
+                continue
+            if reloaded:
+                print(f"[reload] {', '.join(reloaded)}", file=self.log)
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+
+
+def _common_prefix_len(a, b):
+    """Length of the common prefix of two strings, compared in C-level slices"""
+    lo, hi = 0, min(len(a), len(b))
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if a[:mid] == b[:mid]:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+
+class IncrementalSegmenter:
+    """
+    Live-typing front-end for HybridDAGSegmenter.
+
+    Keeps the syllables, DAG edges and Viterbi state of the current text. After an
+    append or edit only the syllables from the first affected one onward are re-split,
+    only DAG edges that reach them are rebuilt, and Viterbi relaxation restarts there,
+    so the work per keystroke follows the distance from the edit to the end of the text.
+    The result is identical to segmenter.segment() on the full text. Decoding is exact
+    Viterbi, so a segmenter configured with beam, max_states_per_node or
+    max_edges_per_node pruning is rejected: a pruned search cannot be resumed from the edit point.
+
+    Space removal, whitespace normalization and post-editing rules still run over the
+    whole line (regex, C speed). With Bi-MM fallback the Bi-MM path is a whole-line
+    decision, so it is recomputed in full and decoding restarts at the first syllable
+    where it changed.
+
+    Usage:
+        live = IncrementalSegmenter(segmenter)
+        live.append("မနှစ်က")          # -> segmented text so far
+        live.edit(0, 1, "")            # replace raw characters [0, 1)
+    """
+
+    def __init__(self, segmenter, text=''):
+        if segmenter.beam is not None or segmenter.max_edges_per_node or segmenter.max_states_per_node:
+            raise ValueError("IncrementalSegmenter needs exact decoding "
+                             "(no beam, max_states_per_node or max_edges_per_node)")
+        self.segmenter = segmenter
+        self.raw = ''
+        self._reset()
+        if text:
+            self.set_text(text)
+
+    def _reset(self):
+        self.dict_stamp = None
+        self.text = ''
+        self.syllables = []
+        self.offsets = []
+        self.dag = []
+        self.bimm = []
+        self.scores = [0.0]
+        self.paths = [None]
+        self.histories = [[]]
+        self.prefix = [0.0]
+        self.path_nodes = [0]     # nodes and words of the last result's best path
+        self.path_words = []
+        self.stable = 0           # best paths to nodes up to here are unchanged since that result
+
+    def set_text(self, text):
+        return self._update(text)
+
+    def append(self, text):
+        return self._update(self.raw + text)
+
+    def edit(self, start, end, replacement=''):
+        """Replace raw characters [start, end) with replacement"""
+        return self._update(self.raw[:start] + replacement + self.raw[end:])
+
+    def result(self):
+        if not self.syllables:
+            return ''
+        # Backtrack only until the path joins the last result's path at an unchanged node
+        nodes = self.path_nodes
+        tail_nodes, tail_words = [], []
+        idx = len(self.syllables)
+        while True:
+            if idx <= self.stable:
+                pos = bisect.bisect_left(nodes, idx)
+                if pos < len(nodes) and nodes[pos] == idx:
+                    break
+            prev, word = self.paths[idx]
+            tail_nodes.append(idx)
+            tail_words.append(word)
+            idx = prev
+        tail_nodes.reverse()
+        tail_words.reverse()
+        self.path_nodes = nodes[:pos + 1] + tail_nodes
+        self.path_words = self.path_words[:pos] + tail_words
+        self.stable = len(self.syllables)
+        return self.segmenter._finalize(self.path_words)
+
+    def _split_syllables(self, text):
+        result = self.segmenter.break_pattern.sub(r'|\1', text)
+        if result.startswith('|'):
+            result = result[1:]
+        return result.split('|')
+
+    def _update(self, raw):
+        seg = self.segmenter
+        seg._ensure_loaded()
+        if self.dict_stamp != seg._dict_stamp():
+            self._reset()     # cached DAG edges and scores were built with other resources
+            self.dict_stamp = seg._dict_stamp()
+        self.raw = raw
+        text = re.sub(r'\s+', ' ', seg._preprocess_text(raw).strip())
+        if text == self.text:
+            return self.result()
+        if not text:
+            self._reset()
+            return ''
+
+        # A break decision looks one character back and ahead, so the syllable holding
+        # the character two before the first change is the first one that may differ.
+        c = _common_prefix_len(self.text, text)
+        k = max(0, bisect.bisect_right(self.offsets, max(c - 2, 0)) - 1) if self.offsets else 0
+        start_off = self.offsets[k] if self.offsets else 0
+
+        tail = self._split_syllables(text[start_off:])
+        syllables = self.syllables[:k] + tail
+        offsets = self.offsets[:k]
+        pos = start_off
+        for syl in tail:
+            offsets.append(pos)
+            pos += len(syl)
+
+        bimm_by_start = {}
+        if seg.use_bimm_fallback:
+            bimm = seg._get_bimm_segmentation(syllables)
+            common = min(len(self.bimm), len(bimm))
+            first = next((idx for idx in range(common) if self.bimm[idx] != bimm[idx]), common)
+            if first < max(len(self.bimm), len(bimm)):
+                k = min(k, (bimm[first] if first < len(bimm) else self.bimm[first])[0])
+            self.bimm = bimm
+            bimm_by_start = {start: (end, word) for start, end, word in bimm}
+
+        n = len(syllables)
+        lo = max(0, k - seg.max_word_len + 1)
+        dag = self.dag[:lo]
+        for i in range(lo, n):
+            edges = []
+            for j in range(i + 1, min(i + seg.max_word_len + 1, n + 1)):
+                word = ''.join(syllables[i:j])
+                if word in seg._word_dict or j - i == 1:
+                    edges.append((j, word, False))
+            if i in bimm_by_start:
+                end, word = bimm_by_start[i]
+                edges.append((end, word, True))
+            dag.append(edges)
+
+        # Scores for nodes up to k only depend on unchanged syllables and edges
+        scores = self.scores[:k + 1] + [-float('inf')] * (n - k)
+        paths = self.paths[:k + 1] + [None] * (n - k)
+        histories = self.histories[:k + 1] + [[] for _ in range(n - k)]
+        ctx_len = max(1, seg.max_order - 1)
+        # Prefix sums up to syllable k are unchanged, so only the rest is summed
+        prefix = self.prefix[:k] + seg._syl_prefix(syllables, k, self.prefix[k])
+        for i in range(lo, n):
+            for j, word, is_bimm in dag[i]:
+                if j <= k:
+                    continue
+                total = seg._edge_score(histories[i], word, is_bimm, (prefix[j] - prefix[i]) / (j - i))
+                if scores[j] < scores[i] + total:
+                    scores[j] = scores[i] + total
+                    paths[j] = (i, word)
+                    histories[j] = (histories[i] + [word])[-ctx_len:]
+
+        self.text = text
+        self.syllables = syllables
+        self.offsets = offsets
+        self.dag = dag
+        self.scores = scores
+        self.paths = paths
+        self.histories = histories
+        self.prefix = prefix
+        self.stable = min(self.stable, k)
+        return self.result()
+
+
+# === Corpus I/O (JSONL / Parquet) ===
+def token_offsets(text, tokens):
+    """
+    Character offsets of tokens in the original text as a flat [start0, end0, start1, end1, ...] list.
+    Whitespace in the source (e.g. removed by --space-remove-mode) may fall inside a token.
+    Returns None if the tokens cannot be aligned, e.g. after a post-rule rewrote characters.
+    """
+    offsets = []
+    pos = 0
+    length = len(text)
+    for token in tokens:
+        while pos < length and text[pos].isspace():
+            pos += 1
+        start = pos
+        for ch in token:
+            while pos < length and text[pos].isspace() and not ch.isspace():
+                pos += 1
+            if pos >= length or text[pos] != ch:
+                return None
+            pos += 1
+        offsets.extend((start, pos))
+    return offsets
+
+
+def segment_records(segmenter, texts, with_offsets=False, start_idx=0):
+    """Segment a batch of column values, the first being record start_idx; returns (segmented, offsets or None)"""
+    segmented = []
+    offsets = [] if with_offsets else None
+    for idx, text in enumerate(texts, start_idx):
+        if text is None:
+            segmented.append(None)
+            if with_offsets:
+                offsets.append(None)
+            continue
+        result = segmenter.segment(text.strip(), idx)
+        segmented.append(result)
+        if with_offsets:
+            offsets.append(token_offsets(text, result.split()))
+    return segmented, offsets
+
+
+def _batched(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def segment_jsonl(segmenter, input_path, output_path=None, text_column='text',
+                  output_column='segmented', with_offsets=False, batch_size=1000):
+    """Stream a JSONL corpus, adding output_column (and output_column + '_offsets') to each record"""
+    import json
+
+    fin = open_text(input_path)
+    fout = open_text(output_path, 'w') if output_path else sys.stdout
+    try:
+        records = (json.loads(line) for line in fin if line.strip())
+        start_idx = 0
+        for batch in _batched(records, batch_size):
+            segmented, offsets = segment_records(segmenter, [r.get(text_column) for r in batch], with_offsets,
+                                                 start_idx)
+            start_idx += len(batch)
+            for idx, record in enumerate(batch):
+                record[output_column] = segmented[idx]
+                if with_offsets:
+                    record[output_column + '_offsets'] = offsets[idx]
+                fout.write(json.dumps(record, ensure_ascii=False) + '\n')
+    finally:
+        fin.close()
+        if output_path:
+            fout.close()
+
+
+def segment_parquet(segmenter, input_path, output_path, text_column='text',
+                    output_column='segmented', with_offsets=False, batch_size=1000):
+    """Stream a Parquet file in record batches, appending the segmented (and offsets) columns"""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError("pyarrow package required for Parquet support. Install with: pip install pyarrow")
+
+    source = pq.ParquetFile(input_path)
+    writer = None
+    start_idx = 0
+    try:
+        for batch in source.iter_batches(batch_size=batch_size):
+            table = pa.Table.from_batches([batch])
+            segmented, offsets = segment_records(segmenter, table.column(text_column).to_pylist(), with_offsets,
+                                                 start_idx)
+            start_idx += table.num_rows
+            table = table.append_column(output_column, pa.array(segmented, type=pa.string()))
+            if with_offsets:
+                table = table.append_column(output_column + '_offsets', pa.array(offsets, type=pa.list_(pa.int32())))
+            if writer is None:
+                writer = pq.ParquetWriter(output_path, table.schema)
+            writer.write_table(table)
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+# === Compressed and Sharded Text I/O ===
+COMPRESSION_MAGIC = [
+    (b'\x1f\x8b', 'gzip'),
+    (b'\xfd7zXZ\x00', 'xz'),
+    (b'BZh', 'bz2'),
+    (b'\x28\xb5\x2f\xfd', 'zstd'),
+]
+COMPRESSION_EXT = {'.gz': 'gzip', '.xz': 'xz', '.bz2': 'bz2', '.zst': 'zstd'}
+
+
+def _detect_compression(path):
+    with open(path, 'rb') as f:
+        head = f.read(6)
+    for magic, name in COMPRESSION_MAGIC:
+        if head.startswith(magic):
+            return name
+    return None
+
+
+def open_text(path, mode='r'):
+    """Open a UTF-8 text file for 'r' or 'w', (de)compressing gzip/bz2/xz/zstd transparently.
+    Reading detects compression from magic bytes, writing from the file extension."""
+    if mode == 'r':
+        compression = _detect_compression(path)
+    else:
+        compression = COMPRESSION_EXT.get(os.path.splitext(path)[1].lower())
+    if compression is None:
+        return open(path, mode, encoding='utf-8')
+    if compression == 'gzip':
+        import gzip
+        return gzip.open(path, mode + 't', encoding='utf-8')
+    if compression == 'xz':
+        import lzma
+        return lzma.open(path, mode + 't', encoding='utf-8')
+    if compression == 'bz2':
+        import bz2
+        return bz2.open(path, mode + 't', encoding='utf-8')
+    try:
+        import zstandard
+    except ImportError:
+        raise ImportError("zstandard package required for .zst files. Install with: pip install zstandard")
+    import io
+    if mode == 'r':
+        raw = zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'), closefd=True)
+    else:
+        raw = zstandard.ZstdCompressor().stream_writer(open(path, 'wb'), closefd=True)
+    return io.TextIOWrapper(raw, encoding='utf-8')
+
+
+def expand_input_paths(pattern):
+    """Expand a shard glob such as 'part-*.gz' into a sorted list of paths"""
+    import glob
+    if glob.has_magic(pattern):
+        paths = sorted(glob.glob(pattern))
+        if not paths:
+            raise FileNotFoundError(f"No input files match '{pattern}'")
+        return paths
+    return [pattern]
+
+
+def read_lines(paths, chunk_size=1024, prefetch=64):
+    """
+    Yield stripped lines from paths in order. Reading and decompression run in a
+    background thread (zlib/lzma/bz2/zstd release the GIL), so they overlap with
+    segmentation; at most prefetch chunks of chunk_size lines are buffered.
+    """
+    import threading
+    import queue
+
+    chunks = queue.Queue(maxsize=prefetch)
+    end = object()
+
+    def producer():
+        try:
+            for path in paths:
+                with open_text(path) as f:
+                    chunk = []
+                    for line in f:
+                        chunk.append(line.strip())
+                        if len(chunk) >= chunk_size:
+                            chunks.put(chunk)
+                            chunk = []
+                    if chunk:
+                        chunks.put(chunk)
+        except BaseException as e:
+            chunks.put(e)
+        finally:
+            chunks.put(end)
+
+    threading.Thread(target=producer, daemon=True).start()
+    while True:
+        chunk = chunks.get()
+        if chunk is end:
+            return
+        if isinstance(chunk, BaseException):
+            raise chunk
+        yield from chunk
+
+
+# === Line-Offset Index ===
+LINE_INDEX_SUFFIX = '.lidx'
+LINE_INDEX_MAGIC = b'OPPALIDX'
+LINE_INDEX_HEADER = '<8sIIQQQ'   # magic, version, stride, file size, mtime_ns, line count
+
+
+class LineIndex:
+    """
+    Byte offsets of every stride-th line of an uncompressed text file, for random access
+    by line number (0-based, as in --nbest output) without scanning the file.
+
+    LineIndex.open() loads <file>.lidx or, if it is missing or older than the file,
+    builds it with one mmap pass (lines are split in C, per block) and saves it there.
+    Lines end at \\n, \\r\\n or \\r, as for reading the file in text mode.
+    """
+
+    def __init__(self, path, stride, size, mtime_ns, line_count, offsets):
+        self.path = path
+        self.stride = stride
+        self.size = size
+        self.mtime_ns = mtime_ns
+        self.line_count = line_count
+        self.offsets = offsets
+
+    @classmethod
+    def open(cls, path, stride=256, save=True):
+        if _detect_compression(path) is not None:
+            raise ValueError(f"{path}: line ranges need an uncompressed input file")
+        st = os.stat(path)
+        index = cls.load(path + LINE_INDEX_SUFFIX)
+        if index is None or (index.size, index.mtime_ns) != (st.st_size, st.st_mtime_ns):
+            index = cls.build(path, stride)
+            if save:
+                try:
+                    index.save(path + LINE_INDEX_SUFFIX)
+                except OSError as e:
+                    print(f"Warning: cannot save line index: {e}", file=sys.stderr)
+        return index
+
+    @classmethod
+    def build(cls, path, stride=256, block_size=64 << 20):
+        import mmap
+        from array import array
+        from itertools import islice
+        st = os.stat(path)
+        offsets = array('Q')
+        line_no = 0
+        with open(path, 'rb') as f:
+            if st.st_size == 0:
+                return cls(path, stride, 0, st.st_mtime_ns, 0, offsets)
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                base = 0
+                while base < st.st_size:
+                    end = min(base + block_size, st.st_size)
+                    if end < st.st_size:
+                        # cut after a \n, so a line (or a \r\n pair) never spans two blocks
+                        cut = mm.rfind(b'\n', base, end)
+                        end = cut + 1 if cut >= base else mm.find(b'\n', end) + 1 or st.st_size
+                    lines = mm[base:end].splitlines(keepends=True)
+                    starts = accumulate(map(len, lines), initial=base)
+                    offsets.extend(islice(starts, (-line_no) % stride, len(lines), stride))
+                    line_no += len(lines)
+                    base = end
+        return cls(path, stride, st.st_size, st.st_mtime_ns, line_no, offsets)
+
+    @classmethod
+    def load(cls, index_path):
+        import struct
+        from array import array
+        try:
+            with open(index_path, 'rb') as f:
+                header = f.read(struct.calcsize(LINE_INDEX_HEADER))
+                magic, version, stride, size, mtime_ns, line_count = struct.unpack(LINE_INDEX_HEADER, header)
+                if magic != LINE_INDEX_MAGIC or version != 1:
+                    return None
+                offsets = array('Q')
+                offsets.frombytes(f.read())
+        except (OSError, struct.error):
+            return None
+        return cls(index_path[:-len(LINE_INDEX_SUFFIX)], stride, size, mtime_ns, line_count, offsets)
+
+    def save(self, index_path):
+        import struct
+        header = struct.pack(LINE_INDEX_HEADER, LINE_INDEX_MAGIC, 1, self.stride, self.size,
+                             self.mtime_ns, self.line_count)
+        atomic_write(index_path, header + self.offsets.tobytes())
+
+    def byte_offset(self, line):
+        """Offset of the nearest indexed line at or before line"""
+        return self.offsets[line // self.stride] if self.line_count else 0
+
+    def span(self, start, end):
+        """(byte offset, lines to skip, line count) for read_line_span() of lines [start, end)"""
+        end = min(end, self.line_count)
+        return self.byte_offset(start), start % self.stride, max(0, end - start)
+
+    def read_range(self, start, end):
+        """Stripped lines [start, end)"""
+        return read_line_span(self.path, *self.span(start, end))
+
+    def split(self, start, end, parts):
+        """Split lines [start, end) into up to `parts` ranges of about equal bytes"""
+        end = min(end, self.line_count)
+        if start >= end:
+            return []
+        lo, hi = self.byte_offset(start), self.byte_offset(end) if end < self.line_count else self.size
+        bounds = [start]
+        for k in range(1, parts):
+            target = lo + (hi - lo) * k // parts
+            line = bisect.bisect_left(self.offsets, target) * self.stride
+            if bounds[-1] < line < end:
+                bounds.append(line)
+        bounds.append(end)
+        return list(zip(bounds, bounds[1:]))
+
+
+def read_line_span(path, offset, skip, count):
+    """Stripped lines of a text file: from byte offset, skip `skip` lines, then yield `count` lines"""
+    import io
+    if count <= 0:
+        return
+    with open(path, 'rb') as raw:
+        raw.seek(offset)
+        with io.TextIOWrapper(raw, encoding='utf-8') as f:
+            for _ in range(skip):
+                f.readline()
+            for _ in range(count):
+                yield f.readline().strip()
+
+
+def parse_line_ranges(spec):
+    """'5,17,100-200,1000-' -> sorted, merged [(start, end_exclusive), ...]; end None is open"""
+    ranges = []
+    for part in spec.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        first, sep, last = part.partition('-')
+        try:
+            start = int(first)
+            end = (int(last) + 1 if last.strip() else None) if sep else start + 1
+        except ValueError:
+            raise ValueError(f"bad line range '{part}'") from None
+        if start < 0 or (end is not None and end <= start):
+            raise ValueError(f"bad line range '{part}'")
+        ranges.append((start, end))
+    ranges.sort(key=lambda r: (r[0], float('inf') if r[1] is None else r[1]))
+    merged = []
+    for start, end in ranges:
+        if merged and (merged[-1][1] is None or start <= merged[-1][1]):
+            prev_end = merged[-1][1]
+            merged[-1] = (merged[-1][0], None if prev_end is None or end is None else max(prev_end, end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def format_line_output(segmenter, line, idx, nbest=0):
+    """Output text for one input line: the segmentation, or its n-best list"""
+    if nbest:
+        return ''.join(f"{idx}\t{rank}\t{score:.4f}\t{segmented}\n"
+                       for rank, (score, segmented) in enumerate(segmenter.segment_nbest(line, nbest), 1))
+    return segmenter.segment(line, idx) + '\n'
+
+
+def _segment_shard(task):
+    """Worker for --shard-workers: segment one input shard (a file or a line span) into its own output file"""
+    segmenter_kwargs, input_path, output_path, nbest, span, first_idx, word_stats = task
+    segmenter = HybridDAGSegmenter(**segmenter_kwargs)
+    if word_stats:
+        segmenter.word_stats = WordStats()
+    lines = read_line_span(input_path, *span) if span else read_lines([input_path])
+    count = 0
+    with open_text(output_path, 'w') as fout:
+        for idx, line in enumerate(lines, first_idx):
+            fout.write(format_line_output(segmenter, line, idx, nbest))
+            count += 1
+    return count, segmenter.word_stats
+
+
+def _count_lines(path):
+    """Number of lines of an input file: from its line index if uncompressed, else by reading it"""
+    if _detect_compression(path) is None:
+        return LineIndex.open(path, save=False).line_count
+    with open_text(path) as f:
+        return sum(1 for _ in f)
+
+
+def segment_shards_parallel(segmenter_kwargs, paths, fout, workers, nbest=0, index=None, line_ranges=None,
+                            word_stats=None):
+    """
+    Segment shards in worker processes, then append their outputs to fout in shard order.
+    With a LineIndex, the shards are byte-balanced line spans of that one file (optionally
+    restricted to line_ranges), which the workers seek to directly. Otherwise each input
+    file is a shard, and the files' lines are counted first (in parallel) so every shard
+    numbers its lines from its global start, as a sequential run does. The workers' word
+    counts are merged into word_stats when it is given.
+    """
+    import shutil
+    import tempfile
+    from concurrent.futures import ProcessPoolExecutor
+
+    with tempfile.TemporaryDirectory(prefix='oppa_shards_') as tmp_dir, \
+            ProcessPoolExecutor(max_workers=workers) as pool:
+        if index is not None:
+            pieces = [piece for start, end in (line_ranges or [(0, index.line_count)])
+                      for piece in index.split(start, end, workers * 4)]
+            tasks = [(index.path, index.span(start, end), start) for start, end in pieces]
+        else:
+            starts = accumulate(pool.map(_count_lines, paths), initial=0)
+            tasks = [(path, None, first_idx) for path, first_idx in zip(paths, starts)]
+        outputs = [os.path.join(tmp_dir, f'shard_{i:05d}.txt') for i in range(len(tasks))]
+        tasks = [(segmenter_kwargs, path, out, nbest, span, first_idx, word_stats is not None)
+                 for (path, span, first_idx), out in zip(tasks, outputs)]
+        for _, shard_stats in pool.map(_segment_shard, tasks):
+            if word_stats is not None:
+                word_stats.merge(shard_stats)
+        for out in outputs:
+            with open(out, encoding='utf-8') as f:
+                shutil.copyfileobj(f, fout)
+
+
+# === Resumable Chunked Jobs ===
+def atomic_write(path, data):
+    """Write bytes to path via a temporary file and rename, so readers never see a partial file"""
+    tmp_path = f"{path}.tmp.{os.getpid()}"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def load_job_manifest(job_dir):
+    """Completed chunks of a job: {chunk_idx: record}, merged from every manifest*.jsonl in job_dir"""
+    import glob
+    import json
+    done = {}
+    for manifest in sorted(glob.glob(os.path.join(job_dir, 'manifest*.jsonl'))):
+        with open(manifest, encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue   # torn last line after a crash
+                done[record['chunk']] = record
+    return done
+
+
+def _chunk_done(job_dir, record):
+    """A chunk counts as done only if its output still matches the checksum in the manifest"""
+    import hashlib
+    path = os.path.join(job_dir, 'chunks', record['file'])
+    if not os.path.exists(path):
+        return False
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest() == record['sha256']
+
+
+def run_chunked_job(segmenter, paths, job_dir, chunk_lines=100000, output=None,
+                    shard=(0, 1), nbest=0, log=sys.stderr, options=None):
+    """
+    Segment input in numbered chunks of chunk_lines lines. Each chunk output is written
+    atomically to job_dir/chunks/ and recorded with its input and output sha256 in an
+    append-only manifest, so a rerun skips finished chunks and resumes after the last one.
+    shard=(i, n) makes this process handle only chunks with chunk_idx % n == i, so several
+    machines sharing job_dir can split one job. Once every chunk is done the chunks are
+    concatenated into output (if given). Returns True when the whole job is complete.
+
+    The input list, chunk_lines, nbest and `options` (the model options that change the
+    output, see job_model_options()) are recorded in job_dir/job.json; resuming with any
+    of them different raises ValueError, so one result never mixes two models.
+    """
+    import hashlib
+    import json
+
+    shard_idx, num_shards = shard
+    os.makedirs(os.path.join(job_dir, 'chunks'), exist_ok=True)
+    job_file = os.path.join(job_dir, 'job.json')
+    job = {'input': [os.path.abspath(p) for p in paths], 'chunk_lines': chunk_lines, 'nbest': nbest,
+           'options': json.loads(json.dumps(options or {}))}
+    if os.path.exists(job_file):
+        with open(job_file, encoding='utf-8') as f:
+            previous = json.load(f)
+        for key, label in (('input', 'input files'), ('chunk_lines', '--chunk-lines'), ('nbest', '--nbest')):
+            if previous.get(key) != job[key]:
+                raise ValueError(f"Job in {job_dir} was started with {label} {previous.get(key)}, not {job[key]}")
+        old_options = previous.get('options', {})
+        changed = sorted(key for key in set(old_options) | set(job['options'])
+                         if old_options.get(key) != job['options'].get(key))
+        if 'options' not in previous or changed:
+            raise ValueError(f"Job in {job_dir} was started with other model options "
+                             f"({', '.join(changed) or 'not recorded'}); use a new --job-dir")
+    else:
+        atomic_write(job_file, json.dumps(job, ensure_ascii=False, indent=1).encode('utf-8'))
+
+    manifest_name = 'manifest.jsonl' if num_shards == 1 else f'manifest-{shard_idx}-of-{num_shards}.jsonl'
+    done = {idx: rec for idx, rec in load_job_manifest(job_dir).items() if _chunk_done(job_dir, rec)}
+
+    def flush_chunk(chunk_idx, lines):
+        input_sha = hashlib.sha256('\n'.join(lines).encode('utf-8')).hexdigest()
+        if chunk_idx in done:
+            if done[chunk_idx].get('input_sha256') != input_sha:
+                raise ValueError(f"Input of chunk {chunk_idx} changed since it was checkpointed")
+            return
+        if chunk_idx % num_shards != shard_idx:
+            return
+        start = time.perf_counter()
+        first = chunk_idx * chunk_lines
+        data = ''.join(format_line_output(segmenter, line, first + i, nbest)
+                       for i, line in enumerate(lines)).encode('utf-8')
+        name = f'chunk_{chunk_idx:06d}.txt'
+        atomic_write(os.path.join(job_dir, 'chunks', name), data)
+        record = {'chunk': chunk_idx, 'file': name, 'lines': len(lines), 'first_line': first,
+                  'input_sha256': input_sha, 'sha256': hashlib.sha256(data).hexdigest()}
+        with open(os.path.join(job_dir, manifest_name), 'a', encoding='utf-8') as mf:
+            mf.write(json.dumps(record) + '\n')
+            mf.flush()
+            os.fsync(mf.fileno())
+        done[chunk_idx] = record
+        print(f"[job] chunk {chunk_idx} done: {len(lines)} lines in {time.perf_counter() - start:.2f}s",
+              file=log)
+
+    chunk_idx = 0
+    lines = []
+    for line in read_lines(paths):
+        lines.append(line)
+        if len(lines) >= chunk_lines:
+            flush_chunk(chunk_idx, lines)
+            chunk_idx += 1
+            lines = []
+    if lines:
+        flush_chunk(chunk_idx, lines)
+        chunk_idx += 1
+    total_chunks = chunk_idx
+
+    # Other machines may have finished chunks meanwhile
+    done.update({idx: rec for idx, rec in load_job_manifest(job_dir).items()
+                 if idx not in done and _chunk_done(job_dir, rec)})
+    missing = [idx for idx in range(total_chunks) if idx not in done]
+    if missing:
+        print(f"[job] {total_chunks - len(missing)}/{total_chunks} chunks done; "
+              f"waiting for other shards", file=log)
+        return False
+    if output:
+        import shutil
+        with open_text(output, 'w') as fout:
+            for idx in range(total_chunks):
+                with open(os.path.join(job_dir, 'chunks', done[idx]['file']), encoding='utf-8') as f:
+                    shutil.copyfileobj(f, fout)
+    print(f"[job] all {total_chunks} chunks done", file=log)
+    return True
+
+
+def _bytecode_state(started):
+    """How this module was loaded: from cached bytecode, or compiled from source at a time >= started"""
+    cached = globals().get('__cached__')
+    try:
+        if cached and os.stat(cached).st_mtime < started:
+            return 'cached bytecode'
+    except OSError:
+        pass
+    return 'compiled from source'
+
+
+def print_startup_report(segmenter, init_time, first_line_time, module_load=None, stream=sys.stderr):
+    """
+    Print time spent loading this module (compiling or unmarshalling it and running its
+    imports), segmenter setup, each resource loader and the first line. module_load is
+    (seconds, time.time() at its start), as measured by the oppa_word.py entry point.
+    """
+    if module_load is not None:
+        seconds, started = module_load
+        print(f"[startup] load oppa_core ({_bytecode_state(started)}): {seconds * 1000:.1f} ms", file=stream)
+    print(f"[startup] stdlib imports: {IMPORT_TIME * 1000:.1f} ms", file=stream)
+    print(f"[startup] segmenter init: {init_time * 1000:.1f} ms", file=stream)
+    for name, seconds in segmenter.load_times.items():
+        print(f"[startup] load {name}: {seconds * 1000:.1f} ms", file=stream)
+    if first_line_time is not None:
+        print(f"[startup] first line (incl. lazy loads): {first_line_time * 1000:.1f} ms", file=stream)
+
+
+def add_model_arguments(parser):
+    """Options that define the segmenter (model files and scoring); shared by every front-end"""
+    parser.add_argument('--dict', '-d', required=True,
+                        help="Word dictionary file (one word per line)")
+    parser.add_argument('--sylfreq', '-s',
+                        help="Syllable frequency file (syllable<TAB>frequency, for scoring)")
+    parser.add_argument('--arpa', '-a',
+                        help="ARPA-format syllable-level language model (optional)")
+    parser.add_argument('--postrule-file',
+                        help="Optional post-processing rules (e.g., merging, corrections)")
+    parser.add_argument('--max-order', type=int, default=5,
+                        help="Max LM n-gram order (default: 5)")
+    parser.add_argument('--dict-weight', type=float, default=10.0,
+                        help="Dictionary path weight in scoring (default: 10.0)")
+    parser.add_argument('--use-bimm-fallback', action='store_true',
+                        help="Enable Bi-directional Maximum Matching as fallback")
+    parser.add_argument('--bimm-boost', type=float, default=0.0,
+                        help="Boost score added to Bi-MM fallback path (default: 0.0)")
+    parser.add_argument('--space-remove-mode', choices=SPACE_REMOVE_MODES,
+                        help="Preprocessing mode to remove spaces: 'all', 'my' (Myanmar only), or 'my_not_num (Myanmar but not including Myanmar numbers'")
+    parser.add_argument('--max-word-len', type=int, default=6,
+                       help="Maximum word length in syllables (3-12, default:6)")
+    parser.add_argument('--load-workers', type=int, default=1,
+                        help="Processes used to parse large ARPA/frequency files in parallel (default: 1)")
+    parser.add_argument('--load-progress', action='store_true',
+                        help="Show chunk progress while loading ARPA/frequency files in parallel")
+    parser.add_argument('--lm-cache-size', type=int,
+                        help=f"Entries in the LM query cache, 0 disables it (default: {LM_CACHE_SIZE} for a "
+                             f"binary KenLM model, 0 for ARPA, whose lookups are cheaper than the cache)")
+    parser.add_argument('--lm-cache-scope', choices=['process', 'thread'], default='process',
+                        help="Share one LM cache between threads or keep one per thread (default: process)")
+    parser.add_argument('--engine', choices=list(ENGINES), default='python',
+                        help="Viterbi decoding backend: 'numba' runs LM-free decoding in a JIT-compiled "
+                             "kernel (same output, not faster on typical input, adds numba import time) and "
+                             "falls back to 'python' if numba is missing (default: python)")
+    parser.add_argument('--beam', type=float,
+                        help="Beam width for pruned decoding: drop hypotheses this far below the best at a node")
+    parser.add_argument('--max-states-per-node', type=int,
+                        help="Keep only the best N LM states (hypotheses) at each node in pruned decoding")
+    parser.add_argument('--max-edges-per-node', type=int,
+                        help="Expand only the best N outgoing DAG edges per node in pruned decoding")
+
+
+def validate_model_arguments(parser, args):
+    if not 3 <= args.max_word_len <= 12:
+        parser.error("--max-word-len must be between 3 and 12")
+    if args.lm_cache_size is not None and args.lm_cache_size < 0:
+        parser.error("--lm-cache-size must not be negative")
+    if args.beam is not None and args.beam < 0:
+        parser.error("--beam must not be negative")
+    if args.max_edges_per_node is not None and args.max_edges_per_node < 1:
+        parser.error("--max-edges-per-node must be at least 1")
+    if args.max_states_per_node is not None and args.max_states_per_node < 1:
+        parser.error("--max-states-per-node must be at least 1")
+
+
+def parse_shadow_overrides(parser, options):
+    """HybridDAGSegmenter keyword overrides from --shadow OPTION=VALUE strings"""
+    import ast
+    import inspect
+    allowed = set(inspect.signature(HybridDAGSegmenter).parameters)
+    overrides = {}
+    for option in options:
+        key, sep, value = option.partition('=')
+        key = key.strip().replace('-', '_')
+        if not sep or key not in allowed:
+            parser.error(f"--shadow expects OPTION=VALUE with a segmenter option ({', '.join(sorted(allowed))})")
+        try:
+            overrides[key] = ast.literal_eval(value)
+        except (ValueError, SyntaxError):
+            overrides[key] = value
+    return overrides
+
+
+def segmenter_kwargs_from_args(args):
+    """HybridDAGSegmenter keyword arguments from parsed add_model_arguments() options"""
+    return dict(
+        dict_path=args.dict,
+        syl_freq_path=args.sylfreq,
+        arpa_lm_path=args.arpa,
+        max_order=args.max_order,
+        dict_weight=args.dict_weight,
+        postrule_file=args.postrule_file,
+        use_bimm_fallback=args.use_bimm_fallback,
+        bimm_boost=args.bimm_boost,
+        space_remove_mode=args.space_remove_mode,
+        max_word_len=args.max_word_len,
+        load_workers=args.load_workers,
+        load_progress=args.load_progress,
+        beam=args.beam,
+        max_edges_per_node=args.max_edges_per_node,
+        max_states_per_node=args.max_states_per_node,
+        lm_cache_size=args.lm_cache_size,
+        lm_cache_scope=args.lm_cache_scope,
+        engine=args.engine
+    )
+
+
+# Segmenter options that do not change the output (loading, caching, decoding backend)
+OUTPUT_NEUTRAL_OPTIONS = ('load_workers', 'load_progress', 'lm_cache_size', 'lm_cache_scope', 'engine',
+                          'visualize_dag', 'dag_output_dir')
+
+
+def job_model_options(segmenter_kwargs, **extra):
+    """Options that determine a job's output, with model file paths made absolute, for job.json"""
+    options = {key: value for key, value in segmenter_kwargs.items() if key not in OUTPUT_NEUTRAL_OPTIONS}
+    for key in ('dict_path', 'syl_freq_path', 'arpa_lm_path', 'postrule_file'):
+        if options.get(key):
+            options[key] = os.path.abspath(options[key])
+    options.update(extra)
+    return options
+
+
+def main(module_load=None):
+    """Command-line interface; module_load is the entry point's timing of loading this module"""
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="oppa_word, Hybrid DAG + BiMM + LM Myanmar Word Segmenter with optional Aho-Corasick support"
+    )
+    parser.add_argument('--input', '-i', required=True,
+                        help="Input file with one sentence per line (UTF-8, optionally gzip/bz2/xz/zstd compressed); "
+                             "a quoted glob such as 'part-*.gz' reads every matching shard in order")
+    parser.add_argument('--output', '-o',
+                        help="Optional output file path (default: stdout); .gz/.bz2/.xz/.zst are compressed")
+    add_model_arguments(parser)
+    parser.add_argument('--visualize-dag', action='store_true',
+                        help="Generate DAG visualization (PDF per sentence)")
+    parser.add_argument('--dag-output-dir', default='dag_viz',
+                        help="Directory to save DAG PDFs if --visualize-dag is used (default: 'dag_viz')")
+    parser.add_argument('--startup-report', action='store_true',
+                        help="Print time spent loading oppa_core (compiling it or reading its cached bytecode), "
+                             "in imports and in each resource loader to stderr")
+    parser.add_argument('--nbest', type=int, default=0,
+                        help="Output the top-K segmentations per line as line_idx<TAB>rank<TAB>score<TAB>segmentation; "
+                             "rank 1 is the plain output, and with an LM the other ranks are approximate")
+    parser.add_argument('--format', choices=['text', 'jsonl', 'parquet'],
+                        help="Input/output corpus format (default: from the --input extension, else text)")
+    parser.add_argument('--text-column', default='text',
+                        help="Column/field to segment in jsonl/parquet input (default: 'text')")
+    parser.add_argument('--output-column', default='segmented',
+                        help="Column/field to write segmentations to in jsonl/parquet output (default: 'segmented')")
+    parser.add_argument('--offsets', action='store_true',
+                        help="Also write token character offsets as an integer array column (<output-column>_offsets)")
+    parser.add_argument('--batch-size', type=int, default=1000,
+                        help="Records per batch for jsonl/parquet streaming (default: 1000)")
+    parser.add_argument('--threads', type=int, default=1,
+                        help="Segment lines on a thread pool sharing one model (scales on free-threaded Python; default: 1)")
+    parser.add_argument('--watch-resources', type=float, metavar='SECONDS',
+                        help="Poll --dict/--sylfreq/--postrule-file every SECONDS and hot-reload changes (also on SIGHUP)")
+    parser.add_argument('--shard-workers', type=int, default=1,
+                        help="Segment input shards in parallel with this many processes (default: 1, in order)")
+    parser.add_argument('--job-dir',
+                        help="Run as a resumable job: checkpoint chunk outputs and a manifest in this directory")
+    parser.add_argument('--chunk-lines', type=int, default=100000,
+                        help="Lines per checkpointed chunk in --job-dir mode (default: 100000)")
+    parser.add_argument('--job-shard', default='0/1',
+                        help="Handle only chunks with index %% N == I, given as I/N, to split a job across machines")
+    parser.add_argument('--metrics-file',
+                        help="Write Prometheus metrics to this file periodically and at the end of the run")
+    parser.add_argument('--metrics-interval', type=float, default=15.0, metavar='SECONDS',
+                        help="Seconds between --metrics-file updates (default: 15)")
+    parser.add_argument('--metrics-port', type=int,
+                        help="Serve Prometheus metrics at http://HOST:PORT/metrics while running")
+    parser.add_argument('--shadow', action='append', metavar='OPTION=VALUE',
+                        help="Shadow mode: also run a candidate engine with this segmenter option changed "
+                             "(repeatable, e.g. --shadow beam=5 --shadow max_edges_per_node=3) and report "
+                             "divergence and speedup; output still comes from the reference")
+    parser.add_argument('--shadow-sample', type=float, default=1.0,
+                        help="Fraction of lines also run through the shadow candidate (default: 1.0)")
+    parser.add_argument('--shadow-diffs',
+                        help="Write diverging lines with both segmentations and scores as JSON lines")
+    parser.add_argument('--lines', metavar='RANGES',
+                        help="Only segment these 0-based input lines, e.g. '1000000-1999999' or '5,17,100-200,9000-' "
+                             "(single uncompressed text file; a line index is kept in <input>.lidx)")
+    parser.add_argument('--lattice-output',
+                        help="Write a compact JSON-lines lattice per line (alternative to --visualize-dag)")
+    parser.add_argument('--word-stats', metavar='TSV',
+                        help="While segmenting, count output words as dict/nondict and words taken from Bi-MM "
+                             "edges as bimm; write 'word<TAB>count<TAB>kind' lines, most frequent first")
+    parser.add_argument('--pipeline', metavar='STAGES',
+                        help="Run these stages on each line in one pass, in order: space:MODE, segment, "
+                             "postrules:FILE, punc, call:MODULE:FUNCTION (e.g. 'space:my_not_num,segment,punc')")
+    parser.add_argument('--pipeline-timing', action='store_true',
+                        help="Report per-stage time of --pipeline on stderr at the end")
+    parser.add_argument('--slow-lines', type=int, metavar='N',
+                        help="Keep the N slowest lines with syllable count, DAG edges, LM queries and stage "
+                             "timings, and report them on stderr at the end")
+    parser.add_argument('--slow-lines-output',
+                        help="Also write the --slow-lines report as JSON lines to this file")
+    parser.add_argument('--slow-lines-dag', action='store_true',
+                        help="Render the DAG of each --slow-lines line into --dag-output-dir")
+
+    args = parser.parse_args()
+
+    validate_model_arguments(parser, args)
+    if args.nbest < 0:
+        parser.error("--nbest must be a positive number")
+    try:
+        job_shard = tuple(int(x) for x in args.job_shard.split('/'))
+        if len(job_shard) != 2 or not 0 <= job_shard[0] < job_shard[1]:
+            raise ValueError
+    except ValueError:
+        parser.error("--job-shard must be I/N with 0 <= I < N")
+    if args.chunk_lines < 1:
+        parser.error("--chunk-lines must be at least 1")
+    if args.shard_workers > 1 and (args.lattice_output or args.visualize_dag):
+        parser.error("--shard-workers cannot be combined with --lattice-output or --visualize-dag")
+    if args.shard_workers > 1 and (args.metrics_file or args.metrics_port is not None):
+        parser.error("--metrics-file and --metrics-port are not supported with --shard-workers")
+    if args.metrics_interval <= 0:
+        parser.error("--metrics-interval must be positive")
+    if args.shadow and (args.nbest or args.shard_workers > 1):
+        parser.error("--shadow cannot be combined with --nbest or --shard-workers")
+    # only parsed when given: it imports inspect and ast
+    shadow_overrides = parse_shadow_overrides(parser, args.shadow) if args.shadow else {}
+    if not 0.0 <= args.shadow_sample <= 1.0:
+        parser.error("--shadow-sample must be between 0 and 1")
+    if args.word_stats and (args.nbest or args.job_dir):
+        parser.error("--word-stats cannot be combined with --nbest or --job-dir")
+    if args.pipeline and (args.nbest or args.shard_workers > 1):
+        parser.error("--pipeline cannot be combined with --nbest or --shard-workers")
+    if args.pipeline_timing and not args.pipeline:
+        parser.error("--pipeline-timing needs --pipeline")
+    if args.slow_lines is not None and args.slow_lines < 1:
+        parser.error("--slow-lines must be at least 1")
+    if (args.slow_lines_output or args.slow_lines_dag) and not args.slow_lines:
+        parser.error("--slow-lines-output and --slow-lines-dag need --slow-lines")
+    if args.slow_lines and (args.nbest or args.shard_workers > 1):
+        parser.error("--slow-lines cannot be combined with --nbest or --shard-workers")
+
+    segmenter_kwargs = segmenter_kwargs_from_args(args)
+    segmenter_kwargs.update(visualize_dag=args.visualize_dag, dag_output_dir=args.dag_output_dir)
+    init_start = time.perf_counter()
+    segmenter = HybridDAGSegmenter(**segmenter_kwargs)
+    init_time = time.perf_counter() - init_start
+    if args.metrics_file or args.metrics_port is not None:
+        import atexit
+        segmenter.metrics = SegmenterMetrics()
+        if segmenter.lm_cache is not None and segmenter.has_lm:
+            segmenter.metrics.add_cache('lm', segmenter.lm_cache.stats)
+        exporter = MetricsExporter(segmenter.metrics, path=args.metrics_file,
+                                   interval=args.metrics_interval, port=args.metrics_port).start()
+        atexit.register(exporter.stop)
+    if args.word_stats:
+        import atexit
+        segmenter.word_stats = WordStats()
+
+        def write_word_stats(stats=segmenter.word_stats):
+            stats.write(args.word_stats)
+            print(stats.format_summary(), file=sys.stderr)
+        atexit.register(write_word_stats)
+    if args.slow_lines:
+        import atexit
+        segmenter.slow_lines = SlowLineCapture(args.slow_lines)
+
+        def report_slow_lines(seg=segmenter):
+            print(seg.slow_lines.format_report(), file=sys.stderr)
+            if args.slow_lines_output:
+                seg.slow_lines.write(args.slow_lines_output)
+            if args.slow_lines_dag:
+                seg.slow_lines.render_dags(seg, args.dag_output_dir)
+        atexit.register(report_slow_lines)
+    if args.shadow:
+        import atexit
+        candidate = HybridDAGSegmenter(**{**segmenter_kwargs, 'visualize_dag': False, **shadow_overrides})
+        diffs = open_text(args.shadow_diffs, 'w') if args.shadow_diffs else None
+        segmenter = ShadowSegmenter(segmenter, candidate, sample_rate=args.shadow_sample, diffs=diffs)
+
+        def shadow_report(shadow=segmenter):
+            print(shadow.format_report(), file=sys.stderr)
+            if shadow.diffs is not None:
+                shadow.diffs.close()
+        atexit.register(shadow_report)
+    if args.watch_resources:
+        watcher = ResourceWatcher(segmenter, interval=args.watch_resources).start()
+        if hasattr(__import__('signal'), 'SIGHUP'):
+            watcher.install_signal_handler()
+    if args.pipeline:
+        try:
+            segmenter = TextPipeline.from_spec(args.pipeline, segmenter, timing=args.pipeline_timing)
+        except (ValueError, ImportError, AttributeError, OSError) as e:
+            parser.error(f"--pipeline: {e}")
+        if args.pipeline_timing:
+            import atexit
+            atexit.register(lambda pipeline=segmenter: print(pipeline.format_timing(), file=sys.stderr))
+
+    fmt = args.format
+    if fmt is None:
+        base = args.input
+        if os.path.splitext(base)[1].lower() in COMPRESSION_EXT:
+            base = os.path.splitext(base)[0]
+        fmt = {'.jsonl': 'jsonl', '.parquet': 'parquet'}.get(os.path.splitext(base)[1], 'text')
+    if fmt != 'text':
+        if args.lines:
+            parser.error(f"--lines only applies to text input, not {fmt}")
+        if fmt == 'parquet' and not args.output:
+            parser.error("--output is required for parquet format")
+        corpus_io = segment_jsonl if fmt == 'jsonl' else segment_parquet
+        corpus_io(segmenter, args.input, args.output, text_column=args.text_column,
+                  output_column=args.output_column, with_offsets=args.offsets, batch_size=args.batch_size)
+        if args.startup_report:
+            print_startup_report(segmenter, init_time, None, module_load)
+        return
+
+    try:
+        paths = expand_input_paths(args.input)
+    except FileNotFoundError as e:
+        parser.error(str(e))
+
+    index = line_ranges = None
+    if args.lines or (args.shard_workers > 1 and len(paths) == 1 and not args.job_dir):
+        try:
+            if args.lines:
+                if len(paths) != 1 or args.job_dir:
+                    raise ValueError("--lines needs a single input file and cannot be used with --job-dir")
+                line_ranges = parse_line_ranges(args.lines)
+            index = LineIndex.open(paths[0])
+        except ValueError as e:
+            if args.lines:
+                parser.error(str(e))
+        else:
+            if line_ranges:
+                line_ranges = [(start, index.line_count if end is None else min(end, index.line_count))
+                               for start, end in line_ranges if start < index.line_count]
+
+    if args.job_dir:
+        try:
+            complete = run_chunked_job(segmenter, paths, args.job_dir, args.chunk_lines, args.output,
+                                       shard=job_shard, nbest=args.nbest,
+                                       options=job_model_options(segmenter_kwargs, pipeline=args.pipeline))
+        except ValueError as e:
+            parser.error(str(e))
+        if args.startup_report:
+            print_startup_report(segmenter, init_time, None, module_load)
+        sys.exit(0 if complete else 3)
+    fout = open_text(args.output, 'w') if args.output else sys.stdout
+    flat = open(args.lattice_output, 'w', encoding='utf-8') if args.lattice_output else None
+    first_line_time = None
+    if flat:
+        import json
+    if line_ranges is not None:
+        from itertools import chain
+        numbered = chain.from_iterable(enumerate(index.read_range(start, end), start)
+                                       for start, end in line_ranges)
+    else:
+        numbered = enumerate(read_lines(paths))
+    try:
+        if args.shard_workers > 1 and (len(paths) > 1 or index is not None):
+            segment_shards_parallel(segmenter_kwargs, paths, fout, args.shard_workers, args.nbest,
+                                    index=index, line_ranges=line_ranges, word_stats=segmenter.word_stats)
+        elif args.threads > 1:
+            from concurrent.futures import ThreadPoolExecutor
+            segmenter.preload()
+            with ThreadPoolExecutor(max_workers=args.threads) as pool:
+                for batch in _batched(numbered, args.threads * 256):
+                    indices = [idx for idx, _ in batch]
+                    lines = [line for _, line in batch]
+                    for out in pool.map(format_line_output, [segmenter] * len(batch), lines, indices,
+                                        [args.nbest] * len(batch)):
+                        fout.write(out)
+                    if flat:
+                        for i, line in batch:
+                            flat.write(json.dumps(segmenter.lattice(line, i), ensure_ascii=False) + '\n')
+        else:
+            for idx, line in numbered:
+                line_start = time.perf_counter()
+                fout.write(format_line_output(segmenter, line, idx, args.nbest))
+                if first_line_time is None:
+                    first_line_time = time.perf_counter() - line_start
+                if flat:
+                    flat.write(json.dumps(segmenter.lattice(line, idx), ensure_ascii=False) + '\n')
+    finally:
+        if args.output:
+            fout.close()
+        if flat:
+            flat.close()
+
+    if args.startup_report:
+        print_startup_report(segmenter, init_time, first_line_time, module_load)
+
+if __name__ == '__main__':
+    main()
+
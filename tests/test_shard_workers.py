@@ -0,0 +1,43 @@
+"""--shard-workers must write exactly what a sequential run writes"""
+
+import gzip
+import os
+import subprocess
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SEGMENTER = ['-d', os.path.join(ROOT, 'data', 'myg2p_mypos.dict'), '--use-bimm-fallback', '--bimm-boost', '150']
+
+
+def run(*args):
+    return subprocess.run([sys.executable, os.path.join(ROOT, 'oppa_word.py'), *SEGMENTER, *args],
+                          check=True, capture_output=True).stdout
+
+
+@pytest.fixture(scope='module')
+def parts(tmp_path_factory):
+    """The first 300 test lines as five shards of 60 lines, the first two gzip-compressed"""
+    with open(os.path.join(ROOT, 'data', 'otest.1k.word.input'), encoding='utf-8') as f:
+        lines = f.readlines()[:300]
+    directory = tmp_path_factory.mktemp('parts')
+    for i in range(5):
+        data = ''.join(lines[i * 60:(i + 1) * 60]).encode('utf-8')
+        if i < 2:
+            (directory / f'part-{i}.gz').write_bytes(gzip.compress(data))
+        else:
+            (directory / f'part-{i}.txt').write_bytes(data)
+    return str(directory / 'part-*')
+
+
+@pytest.mark.parametrize('extra', [[], ['--nbest', '3']])
+def test_shard_workers_match_sequential(parts, extra):
+    assert run('-i', parts, '--shard-workers', '2', *extra) == run('-i', parts, *extra)
+
+
+def test_shard_workers_match_sequential_line_spans(tmp_path):
+    path = tmp_path / 'input.txt'
+    with open(os.path.join(ROOT, 'data', 'otest.1k.word.input'), encoding='utf-8') as f:
+        path.write_text(''.join(f.readlines()[:300]), encoding='utf-8')
+    assert run('-i', str(path), '--shard-workers', '3', '--nbest', '2') == run('-i', str(path), '--nbest', '2')
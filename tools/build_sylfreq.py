@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+build_sylfreq.py: Build the syllable frequency file used by oppa_word.py --sylfreq.
+
+Text is split with the segmenter's own syllable_break() (after the same optional
+space removal), so the counts match the syllables the decoder looks up. The corpus
+is streamed (plain or gzip/bz2/xz/zstd, globs allowed) and counted in parallel by
+worker processes. The parent merges their counters and, when more than --max-entries
+distinct syllables are held, spills a sorted run to disk and starts afresh, so memory
+stays bounded even for a very long tail. Runs are merged at the end.
+
+Output is one 'count<TAB>syllable' line per syllable, the layout of data/myMono.freq
+(most frequent first by default).
+Outputs of separate runs, e.g. one per machine, can be summed with --merge.
+
+Usage:
+  $ python tools/build_sylfreq.py -i 'corpus/part-*.gz' -o myMono.freq --workers 8
+  $ python tools/build_sylfreq.py --merge -i 'counts/*.freq' -o myMono.freq --min-count 2
+"""
+
+import os
+import sys
+import heapq
+import argparse
+import tempfile
+from collections import Counter, deque
+from itertools import groupby
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from oppa_core import (SPACE_REMOVE_MODES, expand_input_paths, open_text, read_lines,  # noqa: E402
+                       remove_spaces, syllable_break, _batched)
+
+_space_remove_mode = None
+
+
+def _init_worker(space_remove_mode):
+    global _space_remove_mode
+    _space_remove_mode = space_remove_mode
+
+
+def count_syllables(lines):
+    """Counter of the syllables of a batch of lines"""
+    counts = Counter()
+    mode = _space_remove_mode
+    for line in lines:
+        text = remove_spaces(line, mode) if mode else line
+        if not text.strip():
+            continue
+        for syl in syllable_break(text):
+            counts.update(syl.split())
+    return counts
+
+
+def read_freq_file(path):
+    """(syllable, count) pairs of a 'count<TAB>syllable' frequency file"""
+    with open_text(path) as f:
+        for line in f:
+            parts = line.strip().split('\t')
+            if len(parts) != 2:
+                continue
+            count, syl = parts
+            try:
+                yield syl, int(count)
+            except ValueError:
+                continue
+
+
+class SpillingCounter:
+    """Counter that writes sorted runs to tmp_dir once it holds more than max_entries keys"""
+
+    def __init__(self, max_entries, tmp_dir=None):
+        self.max_entries = max_entries
+        self.tmp_dir = tmp_dir
+        self.counts = Counter()
+        self.runs = []
+
+    def update(self, counts):
+        self.counts.update(counts)
+        if len(self.counts) > self.max_entries:
+            self.spill()
+
+    def spill(self):
+        fd, path = tempfile.mkstemp(prefix='sylfreq-run-', suffix='.tsv', dir=self.tmp_dir)
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            for syl in sorted(self.counts):
+                f.write(f"{syl}\t{self.counts[syl]}\n")
+        self.runs.append(path)
+        self.counts = Counter()
+
+    def items(self):
+        """Merged (syllable, count) pairs in syllable order"""
+        if not self.runs:
+            yield from sorted(self.counts.items())
+            return
+        if self.counts:
+            self.spill()
+
+        def run(path):
+            with open(path, encoding='utf-8') as f:
+                for line in f:
+                    syl, count = line.rstrip('\n').split('\t')
+                    yield syl, int(count)
+
+        try:
+            merged = heapq.merge(*(run(path) for path in self.runs), key=lambda item: item[0])
+            for syl, group in groupby(merged, key=lambda item: item[0]):
+                yield syl, sum(count for _, count in group)
+        finally:
+            for path in self.runs:
+                os.remove(path)
+            self.runs = []
+
+
+def write_freq(items, output, min_count=1, sort='count'):
+    """Write 'count<TAB>syllable' lines; sort='count' holds the kept entries in memory"""
+    items = ((syl, count) for syl, count in items if count >= min_count)
+    if sort == 'count':
+        items = sorted(items, key=lambda item: (-item[1], item[0]))
+    fout = open_text(output, 'w') if output else sys.stdout
+    try:
+        for syl, count in items:
+            fout.write(f"{count}\t{syl}\n")
+    finally:
+        if output:
+            fout.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build a syllable frequency file for oppa_word.py --sylfreq")
+    parser.add_argument('--input', '-i', required=True, nargs='+',
+                        help="Corpus files or globs (plain or compressed); with --merge, frequency files")
+    parser.add_argument('--output', '-o',
+                        help="Output file (default: stdout; .gz/.bz2/.xz/.zst are compressed)")
+    parser.add_argument('--merge', action='store_true',
+                        help="Sum existing frequency files instead of counting a corpus")
+    parser.add_argument('--space-remove-mode', choices=SPACE_REMOVE_MODES,
+                        help="Space removal before syllable breaking, as in oppa_word.py")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help="Counting processes (default: number of CPUs)")
+    parser.add_argument('--batch-lines', type=int, default=20000,
+                        help="Lines per counting task (default: 20000)")
+    parser.add_argument('--max-entries', type=int, default=5000000,
+                        help="Distinct syllables held in memory before spilling a run to disk (default: 5000000)")
+    parser.add_argument('--tmp-dir',
+                        help="Directory for spilled runs (default: system temp directory)")
+    parser.add_argument('--min-count', type=int, default=1,
+                        help="Drop syllables seen fewer times (default: 1)")
+    parser.add_argument('--sort', choices=['count', 'syllable'], default='count',
+                        help="Output order; 'syllable' streams the merge without holding it in memory (default: count)")
+    args = parser.parse_args()
+
+    if args.workers < 1 or args.batch_lines < 1 or args.max_entries < 1:
+        parser.error("--workers, --batch-lines and --max-entries must be at least 1")
+    try:
+        paths = [path for pattern in args.input for path in expand_input_paths(pattern)]
+    except FileNotFoundError as e:
+        parser.error(str(e))
+
+    counter = SpillingCounter(args.max_entries, args.tmp_dir)
+    if args.merge:
+        for path in paths:
+            for batch in _batched(read_freq_file(path), args.batch_lines):
+                counts = Counter()
+                for syl, count in batch:
+                    counts[syl] += count
+                counter.update(counts)
+    else:
+        batches = _batched(read_lines(paths), args.batch_lines)
+        if args.workers == 1:
+            _init_worker(args.space_remove_mode)
+            for batch in batches:
+                counter.update(count_syllables(batch))
+        else:
+            from multiprocessing import Pool
+            with Pool(args.workers, initializer=_init_worker, initargs=(args.space_remove_mode,)) as pool:
+                # at most two batches per worker in flight (Pool.imap would read the whole corpus ahead)
+                pending = deque()
+                for batch in batches:
+                    pending.append(pool.apply_async(count_syllables, (batch,)))
+                    if len(pending) >= 2 * args.workers:
+                        counter.update(pending.popleft().get())
+                while pending:
+                    counter.update(pending.popleft().get())
+
+    write_freq(counter.items(), args.output, min_count=args.min_count, sort=args.sort)
+
+
+if __name__ == '__main__':
+    main()
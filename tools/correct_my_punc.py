@@ -1,13 +1,12 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-import re
+import os
 import sys
 import argparse
 
-def correct_segmentation(text):
-    """Correct Myanmar text segmentation by adding space before ၊ and ။"""
-    return re.sub(r'(\S)([၊။])', r'\1 \2', text)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from oppa_core import correct_segmentation  # noqa: E402
 
 def process_stream(input_stream, output_stream):
     """Process input stream and write to output stream"""
@@ -0,0 +1,340 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+wer_align.py: Word error rate with sclite-style .pra and .dtl reports, without SCTK.
+
+Reference and hypothesis are word-segmented lines, either in sclite trn format
+('words ... (spk_1)', paired by utterance id) or plain (paired by line number).
+Each pair is aligned with sclite's default weights (correct 0, substitution 4,
+insertion and deletion 3). The alignment strips the common prefix and suffix,
+then runs a DP restricted to a diagonal band that is widened only until the
+band's cost proves optimal, so near-identical lines cost little more than a
+comparison. Lines are aligned in parallel worker processes.
+
+Writes <output>.pra (per-utterance alignments, as 'sclite -o pra') and
+<output>.dtl (summary, confusion pairs, insertions, deletions, substitutions,
+as 'sclite -o dtl'); column widths follow sclite, i.e. UTF-8 bytes.
+
+Usage:
+  $ python tools/wer_align.py -r exp_2/otest.ref -H exp_2/run.hyp
+  $ python tools/wer_align.py -r test.ref -H test.seg -o reports/test --workers 8
+"""
+
+import os
+import re
+import sys
+import argparse
+from collections import Counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from oppa_core import open_text, _batched  # noqa: E402
+
+SUB_COST, INS_COST, DEL_COST = 4, 3, 3
+LINE_WIDTH = 1000   # sclite wraps alignment lines at this many bytes
+RE_TRN_ID = re.compile(r'^(.*?)\s*\(([^()\s]+)\)\s*$')
+
+# alignment operations, as in the .pra Eval line
+CORRECT, SUB, DEL, INS = ' ', 'S', 'D', 'I'
+
+
+def read_utterances(path, speaker, ignore_case=False):
+    """[(utterance id, words)]; plain lines get the ids <speaker>_1, <speaker>_2, ..."""
+    utterances = []
+    with open_text(path) as f:
+        for n, line in enumerate(f, 1):
+            line = line.strip()
+            if ignore_case:
+                line = line.lower()
+            match = RE_TRN_ID.match(line)
+            if match:
+                utterances.append((match.group(2), match.group(1).split()))
+            else:
+                utterances.append((f"{speaker}_{n}", line.split()))
+    return utterances
+
+
+def _banded_alignment(ref, hyp, band):
+    """
+    Weighted edit-distance alignment visiting only diagonals j - i within `band` of
+    [min(0, m - n), max(0, m - n)]; returns (cost, ops in reverse order).
+    """
+    n, m = len(ref), len(hyp)
+    d_lo = min(0, m - n) - band
+    width = max(0, m - n) + band - d_lo + 1
+    inf = float('inf')
+    # rows are indexed by diagonal, cell (i, j) at t = j - i - d_lo + 1, with an inf border on both
+    # sides: the diagonal predecessor is prev[t], the one above prev[t + 1], the left one cur[t - 1]
+    prev = [inf] * (width + 2)
+    for j in range(min(m, width - 1 + d_lo) + 1):
+        prev[j - d_lo + 1] = j * INS_COST
+    rows = [None]
+    for i in range(1, n + 1):
+        base = i + d_lo - 1
+        word = ref[i - 1]
+        cur = [inf] * (width + 2)
+        ops = [None] * (width + 2)
+        for t in range(max(1, -base), min(width, m - base) + 1):
+            j = base + t
+            # preference on ties: diagonal, then deletion, then insertion
+            best = prev[t]
+            if j and hyp[j - 1] == word:
+                op = CORRECT
+            else:
+                best += SUB_COST
+                op = SUB
+            up = prev[t + 1] + DEL_COST
+            if up < best:
+                best, op = up, DEL
+            left = cur[t - 1] + INS_COST
+            if left < best:
+                best, op = left, INS
+            cur[t] = best
+            ops[t] = op
+        rows.append(ops)
+        prev = cur
+
+    path = []
+    i, j = n, m
+    while i > 0 or j > 0:
+        op = rows[i][j - i - d_lo + 1] if i else INS
+        path.append(op)
+        if op is CORRECT or op is SUB:
+            i, j = i - 1, j - 1
+        elif op is DEL:
+            i -= 1
+        else:
+            j -= 1
+    return prev[m - n - d_lo + 1], path
+
+
+def align(ref, hyp):
+    """Optimal alignment of two word lists as [(op, ref word or None, hyp word or None)]"""
+    start = 0
+    while start < len(ref) and start < len(hyp) and ref[start] == hyp[start]:
+        start += 1
+    end = 0
+    while end < len(ref) - start and end < len(hyp) - start and ref[-1 - end] == hyp[-1 - end]:
+        end += 1
+    mid_ref, mid_hyp = ref[start:len(ref) - end], hyp[start:len(hyp) - end]
+
+    n, m = len(mid_ref), len(mid_hyp)
+    band = 2
+    while True:
+        cost, path = _banded_alignment(mid_ref, mid_hyp, band)
+        # a path leaving the band needs at least |m - n| + 2 (band + 1) insertions/deletions
+        if band >= max(n, m) or cost <= min(INS_COST, DEL_COST) * (abs(m - n) + 2 * (band + 1)):
+            break
+        band *= 2
+
+    result = [(CORRECT, word, word) for word in ref[:start]]
+    i = j = 0
+    for op in reversed(path):
+        if op in (CORRECT, SUB):
+            result.append((op, mid_ref[i], mid_hyp[j]))
+            i, j = i + 1, j + 1
+        elif op == DEL:
+            result.append((op, mid_ref[i], None))
+            i += 1
+        else:
+            result.append((op, None, mid_hyp[j]))
+            j += 1
+    result += [(CORRECT, word, word) for word in ref[len(ref) - end:]]
+    return result
+
+
+def align_batch(pairs):
+    """Alignments of a batch with their .pra REF/HYP/Eval text, formatted in the worker"""
+    results = []
+    for ref, hyp in pairs:
+        alignment = align(ref, hyp)
+        results.append((alignment, format_alignment(alignment)))
+    return results
+
+
+def speaker_of(utt_id):
+    return re.split(r'[_-]', utt_id, maxsplit=1)[0]
+
+
+def format_alignment(alignment):
+    """REF/HYP/Eval lines in sclite's layout (byte widths), wrapped with '>> ' continuation lines"""
+    out = []
+    prefixes = ('REF:  ', 'HYP:  ', 'Eval: ')
+    refs, hyps, evals = [], [], []
+    used = len(prefixes[0])
+    for op, ref_word, hyp_word in alignment:
+        ref_len = len(ref_word.encode('utf-8')) if ref_word is not None else 0
+        hyp_len = len(hyp_word.encode('utf-8')) if hyp_word is not None else 0
+        width = max(ref_len, hyp_len)
+        if used + width + 1 > LINE_WIDTH:
+            out += [prefixes[0] + ' '.join(refs) + ' ', prefixes[1] + ' '.join(hyps) + ' ',
+                    prefixes[2] + ' '.join(evals) + ' ', '']
+            prefixes = ('>> REF:  ', '>> HYP:  ', '>> Eval: ')
+            refs, hyps, evals = [], [], []
+            used = len(prefixes[0])
+        refs.append(ref_word + ' ' * (width - ref_len) if ref_word is not None else '*' * width)
+        hyps.append(hyp_word + ' ' * (width - hyp_len) if hyp_word is not None else '*' * width)
+        evals.append(op.ljust(width))
+        used += width + 1
+    out += [prefixes[0] + ' '.join(refs) + ' ', prefixes[1] + ' '.join(hyps) + ' ',
+            prefixes[2] + ' '.join(evals) + ' ', '']
+    return '\n'.join(out) + '\n'
+
+
+def write_pra(path, system, results):
+    speakers = {}
+    for utt_id, alignment, text in results:
+        speakers.setdefault(speaker_of(utt_id), []).append((utt_id, alignment, text))
+    with open_text(path, 'w') as f:
+        f.write('\n\n\t\tDUMP OF SYSTEM ALIGNMENT STRUCTURE\n\n')
+        f.write(f'System name:   {system}\n\nSpeakers: \n')
+        for k, speaker in enumerate(speakers):
+            f.write(f'   {k:2d}:  {speaker}\n')
+        f.write('\n')
+        for k, (speaker, utterances) in enumerate(speakers.items()):
+            f.write(f'Speaker sentences  {k:2d}:  {speaker}   #utts: {len(utterances)}\n')
+            for utt_id, alignment, text in utterances:
+                counts = Counter(op for op, _, _ in alignment)
+                f.write(f'id: ({utt_id})\n')
+                f.write(f'Scores: (#C #S #D #I) {counts[CORRECT]} {counts[SUB]} {counts[DEL]} {counts[INS]}\n')
+                f.write(text)
+            f.write('\n')
+
+
+def _percent(part, whole):
+    return 100.0 * part / whole if whole else 0.0
+
+
+def _ranked_section(title, counts, fmt):
+    lines = [f'{title:<33}Total                 ({len(counts)})',
+             f'{"":33}With >=  1 occurrences ({len(counts)})', '']
+    ranked = sorted(counts.items(), key=lambda item: (-item[1], item[0]))
+    for rank, (key, count) in enumerate(ranked, 1):
+        lines.append(f'{rank:4d}:{count:5d}  ->  {fmt(key)}')
+    lines += [f'{"":5}-------', f'{sum(counts.values()):10d}', '', '']
+    return lines
+
+
+def summarize(results):
+    totals = Counter()
+    with_errors = Counter()
+    confusions, insertions, deletions, substituted, falsely = Counter(), Counter(), Counter(), Counter(), Counter()
+    for _, alignment, _ in results:
+        counts = Counter(op for op, _, _ in alignment)
+        totals.update(counts)
+        for op in (SUB, DEL, INS):
+            with_errors[op] += counts[op] > 0
+        with_errors['any'] += counts[SUB] + counts[DEL] + counts[INS] > 0
+        for op, ref_word, hyp_word in alignment:
+            if op == SUB:
+                confusions[(ref_word, hyp_word)] += 1
+                substituted[ref_word] += 1
+                falsely[hyp_word] += 1
+            elif op == DEL:
+                deletions[ref_word] += 1
+            elif op == INS:
+                insertions[hyp_word] += 1
+    return totals, with_errors, (confusions, insertions, deletions, substituted, falsely)
+
+
+def write_dtl(path, system, results):
+    totals, with_errors, (confusions, insertions, deletions, substituted, falsely) = summarize(results)
+    sentences = len(results)
+    ref_words = totals[CORRECT] + totals[SUB] + totals[DEL]
+    hyp_words = totals[CORRECT] + totals[SUB] + totals[INS]
+    errors = totals[SUB] + totals[DEL] + totals[INS]
+    lines = [f'DETAILED OVERALL REPORT FOR THE SYSTEM: {system}', '',
+             'SENTENCE RECOGNITION PERFORMANCE', '',
+             f' sentences                                  {sentences:10d}',
+             f' with errors                            {_percent(with_errors["any"], sentences):5.1f}%   '
+             f'({with_errors["any"]:4d})', '']
+    for label, op in (('substitutions', SUB), ('deletions', DEL), ('insertions', INS)):
+        lines.append(f'   with {label:<32}{_percent(with_errors[op], sentences):5.1f}%   ({with_errors[op]:4d})')
+    lines += ['', '', 'WORD RECOGNITION PERFORMANCE', '',
+              f'Percent Total Error       = {_percent(errors, ref_words):6.1f}%   ({errors:4d})', '',
+              f'Percent Correct           = {_percent(totals[CORRECT], ref_words):6.1f}%   ({totals[CORRECT]:4d})', '',
+              f'Percent Substitution      = {_percent(totals[SUB], ref_words):6.1f}%   ({totals[SUB]:4d})',
+              f'Percent Deletions         = {_percent(totals[DEL], ref_words):6.1f}%   ({totals[DEL]:4d})',
+              f'Percent Insertions        = {_percent(totals[INS], ref_words):6.1f}%   ({totals[INS]:4d})',
+              f'Percent Word Accuracy     = {100.0 - _percent(errors, ref_words):6.1f}%', '', '',
+              f'Ref. words                =           ({ref_words:4d})',
+              f'Hyp. words                =           ({hyp_words:4d})',
+              f'Aligned words             =           ({ref_words + totals[INS]:4d})', '']
+    lines += _ranked_section('CONFUSION PAIRS', confusions, lambda pair: f'{pair[0]} ==> {pair[1]}')
+    lines += ['']
+    lines += _ranked_section('INSERTIONS', insertions, str)
+    lines += ['']
+    lines += _ranked_section('DELETIONS', deletions, str)
+    lines += ['']
+    lines += _ranked_section('SUBSTITUTIONS', substituted, str)
+    lines += ["* NOTE: The 'Substitution' words are those reference words",
+              "        for which the recognizer supplied an incorrect word.", '', '']
+    lines += _ranked_section('FALSELY RECOGNIZED', falsely, str)
+    lines += ["* NOTE: The 'Falsely Recognized' words are those hypothesis words",
+              "        which the recognizer incorrectly substituted for a reference word.", '']
+    with open_text(path, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+    return errors, ref_words, totals, with_errors["any"]
+
+
+def pair_utterances(ref, hyp):
+    """(id, ref words, hyp words) by utterance id, in reference order; ValueError on a mismatch"""
+    hyp_by_id = dict(hyp)
+    if len(hyp_by_id) != len(hyp) or len(dict(ref)) != len(ref):
+        raise ValueError("duplicate utterance ids")
+    missing = [utt_id for utt_id, _ in ref if utt_id not in hyp_by_id]
+    extra = len(hyp_by_id) - (len(ref) - len(missing))
+    if missing or extra:
+        raise ValueError(f"reference and hypothesis utterances differ "
+                         f"({len(missing)} missing from the hypothesis, {extra} not in the reference"
+                         + (f", e.g. {missing[0]}" if missing else '') + ")")
+    return [(utt_id, words, hyp_by_id[utt_id]) for utt_id, words in ref]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Word error rate with sclite-style .pra/.dtl reports")
+    parser.add_argument('--reference', '-r', required=True,
+                        help="Reference file: segmented lines, optionally ending with '(utterance_id)'")
+    parser.add_argument('--hypothesis', '-H', required=True,
+                        help="Hypothesis file in the same format")
+    parser.add_argument('--output', '-o',
+                        help="Report prefix; writes <output>.pra and <output>.dtl (default: the hypothesis path)")
+    parser.add_argument('--speaker', default='utt',
+                        help="Speaker id for lines without '(utterance_id)'; they become <speaker>_<line> (default: utt)")
+    parser.add_argument('--ignore-case', '-i', action='store_true',
+                        help="Compare words case-insensitively and report them lower-cased, as 'sclite -i'")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help="Alignment processes (default: number of CPUs)")
+    parser.add_argument('--batch-lines', type=int, default=2000,
+                        help="Utterances per alignment task (default: 2000)")
+    args = parser.parse_args()
+
+    if args.workers < 1 or args.batch_lines < 1:
+        parser.error("--workers and --batch-lines must be at least 1")
+    try:
+        pairs = pair_utterances(read_utterances(args.reference, args.speaker, args.ignore_case),
+                                read_utterances(args.hypothesis, args.speaker, args.ignore_case))
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+
+    batches = list(_batched([(ref, hyp) for _, ref, hyp in pairs], args.batch_lines))
+    if args.workers == 1 or len(batches) == 1:
+        alignments = [alignment for batch in batches for alignment in align_batch(batch)]
+    else:
+        from multiprocessing import Pool
+        with Pool(min(args.workers, len(batches))) as pool:
+            alignments = [alignment for result in pool.imap(align_batch, batches) for alignment in result]
+    results = [(utt_id, alignment, text) for (utt_id, _, _), (alignment, text) in zip(pairs, alignments)]
+
+    prefix = args.output or args.hypothesis
+    system = args.hypothesis
+    write_pra(prefix + '.pra', system, results)
+    errors, ref_words, totals, sentence_errors = write_dtl(prefix + '.dtl', system, results)
+    print(f"WER {_percent(errors, ref_words):.2f}% ({errors}/{ref_words}: "
+          f"S={totals[SUB]} D={totals[DEL]} I={totals[INS]}), "
+          f"sentence errors {_percent(sentence_errors, len(results)):.1f}% ({sentence_errors}/{len(results)}); "
+          f"wrote {prefix}.pra and {prefix}.dtl", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()